@@ -19,6 +19,9 @@ THEME_COLORS = {
 # Use a consistent color palette for all charts
 CHART_COLORS = px.colors.qualitative.Bold
 
+# Most categories (bar, pie; "Other" included) or points (line) a chart draws; larger results are reduced by /chart_data
+CHART_LIMITS = {"bar": 15, "pie": 8, "line": 2000}
+
 BACKEND_URL = "https://redyoib.streamlit.app"
 print(f"[INFO] BACKEND_URL is set to: {BACKEND_URL}")
 
@@ -141,15 +144,77 @@ def show_dataframe_info(df):
     
     return
 
+# Build a DataFrame from a query result in either the columnar or the row payload format
+def result_to_dataframe(result):
+    if "data" in result:
+        # Columnar: one array per column, no per-row dicts to unpack
+        return pd.DataFrame(dict(zip(result["columns"], result["data"])), columns=result["columns"])
+    return pd.DataFrame(result.get("rows", []), columns=result.get("columns"))
+
+# Convert a frame's columns to the types they will be charted as, one vectorized pass per column.
+# types are the SQLite storage classes shipped with columnar results; without them pandas' own
+# inference stands. Text columns that are mostly numbers (numbers stored as TEXT) become numeric.
+def coerce_column_types(df, types=None):
+    for col, col_type in zip(df.columns, types or [None] * len(df.columns)):
+        if df[col].dtype != object or col_type in ("blob", "null"):
+            continue
+        numeric = pd.to_numeric(df[col], errors='coerce')
+        if col_type in ("integer", "real") or numeric.notna().sum() > 0.5 * len(df):
+            df[col] = numeric
+    return df
+
+# Typed DataFrame for a result, built once; with a cache_key (which must identify the result's
+# contents) it is kept in the session, so reruns, tab switches and chart fallbacks reuse it
+TYPED_FRAME_CACHE_SIZE = 32
+
+def typed_dataframe(result, cache_key=None):
+    cache = st.session_state.setdefault("typed_frames", {})
+    if cache_key is not None and cache_key in cache:
+        return cache[cache_key]
+    df = coerce_column_types(result_to_dataframe(result), result.get("types"))
+    if cache_key is not None:
+        if len(cache) >= TYPED_FRAME_CACHE_SIZE:
+            # Dicts keep insertion order, so this drops the oldest frame
+            cache.pop(next(iter(cache)))
+        cache[cache_key] = df
+    return df
+
+# Parse a server-sent event stream into (event, data) pairs as the lines arrive
+def iter_sse(response):
+    event = "message"
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            yield event, json.loads(line[len("data:"):])
+            event = "message"
+
+# Label of the folded-together categories that no kept category already has ("Other", else "Other (2)", ...)
+def other_label(labels):
+    labels = {str(label) for label in labels}
+    label, n = "Other", 1
+    while label in labels:
+        n += 1
+        label = f"Other ({n})"
+    return label
+
+# Have the backend aggregate (top N + "Other") or downsample a query's full result for a chart; None if it can't
+def fetch_chart_data(sql, chart_type, x_col, y_col, limit):
+    try:
+        response = requests.post(f"{BACKEND_URL}/chart_data", json={
+            "sql": sql, "chart_type": chart_type, "x": x_col, "y": y_col, "limit": limit, "format": "columnar"
+        })
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    result = response.json().get("result", {})
+    return None if "error" in result else result
+
 # Add this function above the create_chart function
 
-def prepare_grouped_data(data, chart_prefs):
-    """Prepare data for charting when it has grouped results"""
-    import pandas as pd
-    
-    # Convert to DataFrame
-    df = pd.DataFrame(data)
-    
+def prepare_grouped_data(df, chart_prefs):
+    """Prepare data for charting when it has grouped results (df as built by typed_dataframe)"""
     # Check if this looks like grouped data (has product and time period columns)
     has_product = any('product' in col.lower() for col in df.columns)
     has_time = any(col.lower() in ['month', 'year', 'date', 'quarter'] for col in df.columns)
@@ -205,37 +270,15 @@ def prepare_grouped_data(data, chart_prefs):
     return None
 
 # Function to create chart based on data
-def create_chart(data, chart_type="bar", preferred_x=None, preferred_y=None):
-    if not data or len(data) == 0:
+# sql, when given, lets large or partial (complete=False) results be reduced server-side over all their rows
+def create_chart(data, chart_type="bar", preferred_x=None, preferred_y=None, sql=None, complete=True):
+    if data is None or len(data) == 0:
         st.warning("No data to visualize")
         return None
     
-    # Since we're getting dict-type data, need to normalize it
-    # Explicitly convert dict-type data to a properly structured DataFrame
-    normalized_data = []
-    for row in data:
-        # Handle various possible row types to ensure consistent data
-        if isinstance(row, dict):
-            normalized_data.append(row)
-        elif isinstance(row, (list, tuple)):
-            # This handles raw tuple data by assuming the positions match column order
-            # We'll handle column names later
-            obj = {}
-            for i, val in enumerate(row):
-                obj[f"col_{i}"] = val
-            normalized_data.append(obj)
-    
-    # If normalization didn't result in data, try using the raw data
-    if not normalized_data and data:
-        try:
-            # Try directly with pandas - might work if data is already in a suitable format
-            df = pd.DataFrame(data)
-        except Exception as e:
-            st.error(f"Failed to process data: {str(e)}")
-            return None
-    else:
-        # Use the normalized data
-        df = pd.DataFrame(normalized_data)
+    # Column types are settled once by typed_dataframe and frames may be shared through its cache,
+    # so nothing below converts or modifies df in place
+    df = data if isinstance(data, pd.DataFrame) else coerce_column_types(pd.DataFrame(data))
     
     # Check if we have data in the DataFrame
     if df.empty:
@@ -245,38 +288,9 @@ def create_chart(data, chart_type="bar", preferred_x=None, preferred_y=None):
     # Debug display
     st.write("DataFrame structure after normalization:", df.shape)
     
-    # Try to identify numeric columns for charts
     numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
     
-    # Try to convert any string columns that contain numbers to numeric
-    for col in df.columns:
-        if col not in numeric_cols:
-            # Check if column has string data that might be numeric
-            if df[col].dtype == 'object':  
-                try:
-                    # Convert to numeric and check if it worked
-                    numeric_series = pd.to_numeric(df[col], errors='coerce')
-                    # If we don't lose too many values, convert the column
-                    if numeric_series.notna().sum() > 0.5 * len(df):
-                        df[col] = numeric_series
-                        numeric_cols.append(col)
-                except:
-                    pass
-    
-    # Special case: Handle if every column is a string (common with SQLite results)
-    if not numeric_cols and len(df.columns) >= 2:
-        # Try to identify a column that might contain numbers stored as strings
-        for col in df.columns:
-            sample = df[col].astype(str).str.strip().iloc[:5].tolist()
-            # Check if they look like numbers
-            if all(s.replace('.', '').replace('-', '').isdigit() for s in sample if s):
-                try:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                    numeric_cols.append(col)
-                except:
-                    pass
-    
-    # If we still have no numeric columns, we can't create a chart
+    # If we have no numeric columns, we can't create a chart
     if not numeric_cols:
         st.warning("No numeric data found for charting. Try a different query.")
         return None
@@ -284,32 +298,21 @@ def create_chart(data, chart_type="bar", preferred_x=None, preferred_y=None):
     # Y-axis selection (prioritize user preference)
     y_col = None
     if preferred_y:
-        # Try to find a column containing the preferred term
-        for col in df.columns:
-            if preferred_y.lower() in col.lower():
-                # Make sure it's numeric or can be converted
-                try:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                    if not df[col].isna().all():
-                        y_col = col
-                        st.info(f"Using '{y_col}' for Y-axis based on your request for '{preferred_y}'")
-                        break
-                except:
-                    pass
+        # Try to find a numeric column containing the preferred term
+        for col in numeric_cols:
+            if preferred_y.lower() in col.lower() and df[col].notna().any():
+                y_col = col
+                st.info(f"Using '{y_col}' for Y-axis based on your request for '{preferred_y}'")
+                break
     
     # If no preferred column found, look for common numeric columns
     if not y_col:
         for term in ['total_amount', 'amount', 'total', 'price', 'quantity', 'sum']:
-            for col in df.columns:
-                if term.lower() in col.lower():
-                    try:
-                        df[col] = pd.to_numeric(df[col], errors='coerce')
-                        if not df[col].isna().all():
-                            y_col = col
-                            st.info(f"Automatically selected '{y_col}' for Y-axis")
-                            break
-                    except:
-                        pass
+            for col in numeric_cols:
+                if term.lower() in col.lower() and df[col].notna().any():
+                    y_col = col
+                    st.info(f"Automatically selected '{y_col}' for Y-axis")
+                    break
             if y_col:
                 break
     
@@ -352,6 +355,16 @@ def create_chart(data, chart_type="bar", preferred_x=None, preferred_y=None):
                 x_col = df.index
                 st.info("Using row index for X-axis")
     
+    # Let the backend reduce the full result rather than plotting every row (or only the rows we have)
+    limit = CHART_LIMITS.get(chart_type)
+    if sql and limit and isinstance(x_col, str):
+        too_large = df[x_col].nunique() > limit if chart_type in ("bar", "pie") else len(df) > limit
+        if too_large or not complete:
+            reduced = fetch_chart_data(sql, chart_type, x_col, y_col, limit)
+            if reduced is not None:
+                df = typed_dataframe(reduced)
+                st.caption(f"Chart summarizes all {reduced['source_rows']} rows of the result")
+    
     # Create the appropriate chart
     try:
         if chart_type == "bar":
@@ -366,7 +379,7 @@ def create_chart(data, chart_type="bar", preferred_x=None, preferred_y=None):
                 if not other_rows.empty:
                     other_sum = other_rows[y_col].sum()
                     other_row = other_rows.iloc[0].copy()
-                    other_row[x_col] = "Other"
+                    other_row[x_col] = other_label(top_categories)
                     other_row[y_col] = other_sum
                     df_filtered = pd.concat([df_filtered, pd.DataFrame([other_row])])
                 fig = px.bar(df_filtered, x=x_col, y=y_col, 
@@ -397,7 +410,7 @@ def create_chart(data, chart_type="bar", preferred_x=None, preferred_y=None):
                 other_sum = df[~df[x_col].isin(top_categories)][y_col].sum()
                 
                 # Create the "Other" data point
-                other_data = {x_col: "Other", y_col: other_sum}
+                other_data = {x_col: other_label(top_categories), y_col: other_sum}
                 df_pie = pd.concat([df_top, pd.DataFrame([other_data])])
                 
                 fig = px.pie(df_pie, names=x_col, values=y_col, 
@@ -458,14 +471,28 @@ def create_chart(data, chart_type="bar", preferred_x=None, preferred_y=None):
 
 tab1, tab2 = st.tabs(["💬 Query", "📌 Pinned Reports"])
 
+# Fetch a page of query history (matching search, if given) after cursor; None if the backend is unavailable
+def fetch_history_page(search="", cursor=None):
+    params = {"cursor": cursor} if cursor is not None else {}
+    if search:
+        history_response = requests.get(f"{BACKEND_URL}/query_history/search", params={"q": search, **params})
+    else:
+        history_response = requests.get(f"{BACKEND_URL}/query_history", params=params)
+    if history_response.status_code != 200:
+        return None
+    return history_response.json()
+
 # Initialize query history in session state if it doesn't exist
 if 'query_history' not in st.session_state:
     st.session_state.query_history = []
+    st.session_state.history_cursor = None
+    st.session_state.history_search = ""
     # Try to fetch existing history from backend
     try:
-        history_response = requests.get(f"{BACKEND_URL}/query_history")
-        if history_response.status_code == 200:
-            st.session_state.query_history = history_response.json()
+        page = fetch_history_page()
+        if page is not None:
+            st.session_state.query_history = page["items"]
+            st.session_state.history_cursor = page["next_cursor"]
     except:
         # If backend is not available, continue with empty history
         pass
@@ -479,62 +506,81 @@ def run_saved_query(query_text):
     # This function will be called when a history item is clicked
     # It executes the query directly
     with st.spinner("Re-running query..."):
-        response = requests.post(f"{BACKEND_URL}/query", json={"user_query": query_text})
+        response = requests.post(f"{BACKEND_URL}/query", json={"user_query": query_text, "format": "columnar"})
         if response.status_code == 200:
             res = response.json()
-            sql = res["sql"]
-            result = res["result"]
-            understanding = res.get("understanding", "")
-            
-            st.session_state.last_query = query_text
-            st.session_state.last_sql = sql
-            
-            # Display the understanding first
-            if understanding:
-                st.markdown("#### 🧠 Understanding of your question")
-                st.info(understanding)
+            show_saved_result(query_text, res["sql"], res.get("understanding", ""), res["result"])
+
+# Function to replay a history entry from its stored snapshot (or re-execute its SQL)
+def replay_history_item(hist_id, query_text, reexecute=False):
+    with st.spinner("Re-executing saved SQL..." if reexecute else "Loading saved result..."):
+        response = requests.get(f"{BACKEND_URL}/query_history/{hist_id}",
+                                params={"format": "columnar", "reexecute": reexecute})
+        if response.status_code == 200:
+            res = response.json()
+            if "error" in res and "result" not in res:
+                st.error(res["error"])
+                return
+            if res.get("from_snapshot"):
+                st.caption(f"Saved result from {res['timestamp']}")
+            # A snapshot never changes, so its typed frame can be reused on the next replay
+            show_saved_result(query_text, res["sql"], res.get("understanding", ""), res["result"],
+                              cache_key=("history", hist_id) if res.get("from_snapshot") else None)
+
+def show_saved_result(query_text, sql, understanding, result, cache_key=None):
+    st.session_state.last_query = query_text
+    st.session_state.last_sql = sql
+    
+    # Display the understanding first
+    if understanding:
+        st.markdown("#### 🧠 Understanding of your question")
+        st.info(understanding)
+    
+    # Display SQL without using an expander (since we're already in an expander)
+    st.markdown("#### 🧾 SQL Query")
+    st.code(sql, language="sql")
+    
+    if "error" in result:
+        st.error(f"SQL Error: {result['error']}")
+    else:
+        # Display tabs for different views
+        result_tabs = st.tabs(["📊 Table", "📈 Chart"])
+        
+        df = typed_dataframe(result, cache_key)
+        
+        with result_tabs[0]:
+            if not df.empty:
+                st.dataframe(df, use_container_width=True)
+            else:
+                st.info("No data returned from query")
             
-            # Display SQL without using an expander (since we're already in an expander)
-            st.markdown("#### 🧾 SQL Query")
-            st.code(sql, language="sql")
+        with result_tabs[1]:
+            # Generate chart
+            chart_prefs = extract_chart_preferences(query_text)
+            chart_type = chart_prefs.get('chart_type', 'bar')
             
-            if "error" in result:
-                st.error(f"SQL Error: {result['error']}")
-            else:
-                # Display tabs for different views
-                result_tabs = st.tabs(["📊 Table", "📈 Chart"])
+            if not df.empty:
+                # First try the specialized grouped data handler
+                grouped_chart = prepare_grouped_data(df, chart_prefs)
                 
-                with result_tabs[0]:
-                    if result["rows"]:
-                        st.dataframe(result["rows"], use_container_width=True)
-                    else:
-                        st.info("No data returned from query")
-                    
-                with result_tabs[1]:
-                    # Generate chart
-                    chart_prefs = extract_chart_preferences(query_text)
-                    chart_type = chart_prefs.get('chart_type', 'bar')
-                    
-                    if result["rows"]:
-                        # First try the specialized grouped data handler
-                        grouped_chart = prepare_grouped_data(result["rows"], chart_prefs)
-                        
-                        if grouped_chart:
-                            st.plotly_chart(grouped_chart, use_container_width=True)
-                        else:
-                            # Fall back to regular chart creation
-                            chart = create_chart(
-                                result["rows"], 
-                                chart_type, 
-                                preferred_x=chart_prefs['x_column'],
-                                preferred_y=chart_prefs['y_column']
-                            )
-                            if chart:
-                                st.plotly_chart(chart, use_container_width=True)
-                            else:
-                                st.warning("Could not create chart. Try a different query or chart type.")
+                if grouped_chart:
+                    st.plotly_chart(grouped_chart, use_container_width=True)
+                else:
+                    # Fall back to regular chart creation
+                    chart = create_chart(
+                        df, 
+                        chart_type, 
+                        preferred_x=chart_prefs['x_column'],
+                        preferred_y=chart_prefs['y_column'],
+                        sql=sql,
+                        complete=not (result.get("has_more") or result.get("truncated"))
+                    )
+                    if chart:
+                        st.plotly_chart(chart, use_container_width=True)
                     else:
-                        st.info("No data available for chart.")
+                        st.warning("Could not create chart. Try a different query or chart type.")
+            else:
+                st.info("No data available for chart.")
 
 # Function to copy query to input
 def rerun_query(query):
@@ -553,17 +599,34 @@ with tab1:
             # Extract chart preferences from query
             chart_prefs = extract_chart_preferences(user_query)
             
-            with st.spinner("Generating SQL and fetching results..."):
-                response = requests.post(f"{BACKEND_URL}/query", json={"user_query": user_query})
-                st.json({"data": BACKEND_URL})
-                print(f"[INFO] BACKEND_URL is set to: {response}")
-                st.json({"data": response})
-                if response.status_code == 200:
-                    res = response.json()
-                    sql = res["sql"]
-                    result = res["result"]
-                    understanding = res.get("understanding", "")
-                    
+            # The understanding is shown as the model writes it, then the SQL, then the rows
+            response = requests.post(f"{BACKEND_URL}/query/stream",
+                                     json={"user_query": user_query, "format": "columnar"}, stream=True)
+            if response.status_code == 200:
+                understanding_header = st.empty()
+                understanding_box = st.empty()
+                sql_header = st.empty()
+                sql_box = st.empty()
+                status = st.empty()
+                status.caption("Generating SQL...")
+                understanding, sql, result = "", None, None
+                for event, data in iter_sse(response):
+                    if event == "understanding":
+                        understanding += data["delta"]
+                        understanding_header.markdown("#### 🧠 Understanding of your question")
+                        understanding_box.info(understanding)
+                    elif event == "sql":
+                        sql = data["sql"]
+                        understanding = data["understanding"]
+                        sql_header.markdown("#### 🧾 SQL Query")
+                        sql_box.code(sql, language="sql")
+                        status.caption("Fetching results...")
+                    elif event == "result":
+                        result = data
+                        status.empty()
+                    elif event == "error":
+                        status.error(data["error"])
+                if sql is not None and result is not None:
                     # Add to query history
                     timestamp = pd.Timestamp.now().strftime("%H:%M:%S")
                     st.session_state.query_history.append({
@@ -573,15 +636,6 @@ with tab1:
                         "understanding": understanding
                     })
                     
-                    # Display the understanding first
-                    if understanding:
-                        st.markdown("#### 🧠 Understanding of your question")
-                        st.info(understanding)
-                    
-                    # Display SQL without using an expander (since we're already in an expander)
-                    st.markdown("#### 🧾 SQL Query")
-                    st.code(sql, language="sql")
-                    
                     # Store query in session state for pinning later
                     st.session_state.last_query = user_query
                     st.session_state.last_sql = sql
@@ -593,9 +647,13 @@ with tab1:
                         # Display tabs for different views
                         result_tabs = st.tabs(["📊 Table", "📈 Chart"])
                         
+                        df = typed_dataframe(result)
+                        
                         with result_tabs[0]:
-                            if result["rows"]:
-                                st.dataframe(result["rows"], use_container_width=True)
+                            if not df.empty:
+                                st.dataframe(df, use_container_width=True)
+                                if result.get("has_more"):
+                                    st.caption(f"Showing the first {len(df)} rows")
                             else:
                                 st.info("No data returned from query")
                             
@@ -612,19 +670,21 @@ with tab1:
                                 )
                             
                             # Generate chart with preferences from query
-                            if result["rows"]:
+                            if not df.empty:
                                 # First try the specialized grouped data handler
-                                grouped_chart = prepare_grouped_data(result["rows"], chart_prefs)
+                                grouped_chart = prepare_grouped_data(df, chart_prefs)
                                 
                                 if grouped_chart:
                                     st.plotly_chart(grouped_chart, use_container_width=True)
                                 else:
                                     # Fall back to regular chart creation
                                     chart = create_chart(
-                                        result["rows"], 
+                                        df, 
                                         chart_type, 
                                         preferred_x=chart_prefs['x_column'],
-                                        preferred_y=chart_prefs['y_column']
+                                        preferred_y=chart_prefs['y_column'],
+                                        sql=sql,
+                                        complete=not (result.get("has_more") or result.get("truncated"))
                                     )
                                     if chart:
                                         st.plotly_chart(chart, use_container_width=True)
@@ -635,8 +695,8 @@ with tab1:
                                 
                             # Store chart type for pinning
                             st.session_state.last_chart_type = chart_type
-                else:
-                    st.error("Failed to connect to backend.")
+            else:
+                st.error("Failed to connect to backend.")
     
     # Add pin button outside the Run Query button's block
     if st.session_state.get('last_query') and st.session_state.get('last_sql'):
@@ -651,16 +711,22 @@ with tab1:
                 st.success("Query pinned successfully!")
     
     # Display query history
-    if st.session_state.query_history:
+    if st.session_state.query_history or st.session_state.history_search:
         st.markdown("---")
         st.subheader("📜 Query History")
         
-        # Refresh history button
-        if st.button("🔄 Refresh History", key="refresh_history_btn"):
-            history_response = requests.get(f"{BACKEND_URL}/query_history")
-            if history_response.status_code == 200:
-                st.session_state.query_history = history_response.json()
-                st.success("Query history refreshed")
+        # Search box and refresh button; both reload the first page from the backend
+        search = st.text_input("🔎 Search history", value=st.session_state.history_search,
+                               key="history_search_input", placeholder="Words from a question, SQL or understanding")
+        refresh = st.button("🔄 Refresh History", key="refresh_history_btn")
+        if refresh or search != st.session_state.history_search:
+            page = fetch_history_page(search)
+            if page is not None:
+                st.session_state.history_search = search
+                st.session_state.query_history = page["items"]
+                st.session_state.history_cursor = page["next_cursor"]
+                if refresh:
+                    st.success("Query history refreshed")
         
         for i, hist_item in enumerate(st.session_state.query_history):
             # Use a unique prefix for history items to avoid conflict with pinned items
@@ -672,29 +738,88 @@ with tab1:
                 st.markdown("##### 🧾 SQL Query")
                 st.code(hist_item["sql"], language="sql")
                 
-                # Add two buttons - one to copy to input, one to run directly
-                col1, col2 = st.columns(2)
+                # Copy to input, show the saved result, or run the saved SQL again
+                col1, col2, col3 = st.columns(3)
                 with col1:
                     if st.button(f"📋 Copy to input", key=f"hist_copy_{hist_id}_{i}"):
                         rerun_query(hist_item["query"])
                 with col2:
                     if st.button(f"▶️ Run directly", key=f"hist_run_{hist_id}_{i}"):
-                        run_saved_query(hist_item["query"])
+                        if "id" in hist_item:
+                            replay_history_item(hist_item["id"], hist_item["query"])
+                        else:
+                            # Added this session and not reloaded from the backend yet
+                            run_saved_query(hist_item["query"])
+                with col3:
+                    if "id" in hist_item and st.button(f"🔁 Re-execute", key=f"hist_reexec_{hist_id}_{i}"):
+                        replay_history_item(hist_item["id"], hist_item["query"], reexecute=True)
+        
+        # Pages are fetched with the cursor of the previous one, so older pages load as fast as the first
+        if st.session_state.history_cursor is not None:
+            if st.button("⬇️ Load more", key="history_load_more_btn"):
+                page = fetch_history_page(st.session_state.history_search, st.session_state.history_cursor)
+                if page is not None:
+                    st.session_state.query_history.extend(page["items"])
+                    st.session_state.history_cursor = page["next_cursor"]
+                    st.rerun()
+        elif st.session_state.history_search and not st.session_state.query_history:
+            st.info("No history entries match your search.")
     else:
         st.info("No query history yet. Ask some questions to build up your history.")
 
+# Render a pinned report's rows into its table and chart tabs
+def show_pinned_result(df, chart_type, chart_prefs, view_tabs, sql=None, complete=True):
+    with view_tabs[0]:
+        st.dataframe(df, use_container_width=True)
+    
+    with view_tabs[1]:
+        # First try the specialized grouped data handler
+        grouped_chart = prepare_grouped_data(df, chart_prefs)
+        
+        if grouped_chart:
+            st.plotly_chart(grouped_chart, use_container_width=True)
+        else:
+            # Fall back to the saved chart type
+            chart = create_chart(
+                df, 
+                chart_type,
+                preferred_x=chart_prefs['x_column'],
+                preferred_y=chart_prefs['y_column'],
+                sql=sql,
+                complete=complete
+            )
+            if chart:
+                st.plotly_chart(chart, use_container_width=True)
+            else:
+                # Fall back to trying different charts
+                for alt_chart_type in ["bar", "line", "pie"]:
+                    if alt_chart_type != chart_type:
+                        chart = create_chart(
+                            df, 
+                            alt_chart_type,
+                            preferred_x=chart_prefs['x_column'],
+                            preferred_y=chart_prefs['y_column'],
+                            sql=sql,
+                            complete=complete
+                        )
+                        if chart:
+                            st.info(f"Could not create {chart_type} chart, showing {alt_chart_type} instead.")
+                            st.plotly_chart(chart, use_container_width=True)
+                            break
+                else:
+                    st.warning("Could not generate any chart for this data.")
+
 with tab2:
     st.subheader("📌 Pinned Reports")
+    # Pins come with their latest materialized result, so nothing is executed at page load
     pins = requests.get(f"{BACKEND_URL}/pins").json()
 
     if pins:
         for pin in pins:
-            # Now pins includes chart_type (id, question, sql, chart_type)
-            if len(pin) >= 4:
-                pin_id, question, sql, chart_type = pin
-            else:
-                pin_id, question, sql = pin
-                chart_type = "bar"  # Default for older pins
+            pin_id = pin["id"]
+            question = pin["user_query"]
+            sql = pin["sql_query"]
+            chart_type = pin.get("chart_type") or "bar"
                 
             # Extract chart preferences from pinned question
             chart_prefs = extract_chart_preferences(question)
@@ -704,45 +829,21 @@ with tab2:
                 st.code(sql, language="sql")
                 view_tabs = st.tabs(["📊 Table", "📈 Chart"])
                 
+                result = pin.get("result")
                 if st.button(f"▶️ Run pinned query", key=f"pinned_run_{pin_id}"):
-                    result = requests.post(f"{BACKEND_URL}/query", json={"user_query": question}).json()
-                    if "result" in result and "rows" in result["result"]:
-                        with view_tabs[0]:
-                            st.dataframe(result["result"]["rows"], use_container_width=True)
-                        
-                        with view_tabs[1]:
-                            # First try the specialized grouped data handler
-                            grouped_chart = prepare_grouped_data(result["result"]["rows"], chart_prefs)
-                            
-                            if grouped_chart:
-                                st.plotly_chart(grouped_chart, use_container_width=True)
-                            else:
-                                # Fall back to the saved chart type
-                                chart = create_chart(
-                                    result["result"]["rows"], 
-                                    chart_type,
-                                    preferred_x=chart_prefs['x_column'],
-                                    preferred_y=chart_prefs['y_column']
-                                )
-                                if chart:
-                                    st.plotly_chart(chart, use_container_width=True)
-                                else:
-                                    # Fall back to trying different charts
-                                    for alt_chart_type in ["bar", "line", "pie"]:
-                                        if alt_chart_type != chart_type:
-                                            chart = create_chart(
-                                                result["result"]["rows"], 
-                                                alt_chart_type,
-                                                preferred_x=chart_prefs['x_column'],
-                                                preferred_y=chart_prefs['y_column']
-                                            )
-                                            if chart:
-                                                st.info(f"Could not create {chart_type} chart, showing {alt_chart_type} instead.")
-                                                st.plotly_chart(chart, use_container_width=True)
-                                                break
-                                    else:
-                                        st.warning("Could not generate any chart for this data.")
-                    else:
-                        st.warning("No results found or query failed.")
+                    # Re-execute the stored SQL so the report matches what was pinned
+                    result = requests.post(f"{BACKEND_URL}/pins/{pin_id}/run").json().get("result")
+                elif pin.get("refreshed_at"):
+                    st.caption(f"Last refreshed {pin['refreshed_at']} · {pin['row_count']} rows")
+                
+                if result and ("rows" in result or "data" in result):
+                    # Materialized results are identified by their refresh time; a manual run is typed afresh
+                    cache_key = ("pin", pin_id, pin.get("refreshed_at")) if result is pin.get("result") else None
+                    show_pinned_result(typed_dataframe(result, cache_key), chart_type, chart_prefs, view_tabs,
+                                       sql=sql, complete=not result.get("truncated"))
+                elif result and "error" in result:
+                    st.error(f"SQL Error: {result['error']}")
+                else:
+                    st.info("Not refreshed yet. Click ▶️ Run pinned query to run it now.")
     else:
         st.info("No pinned queries yet.")
@@ -0,0 +1,128 @@
+"""Translate and run many questions in one call.
+
+Repeated questions (the same text up to surrounding whitespace) are run once,
+the rest are answered from the translation cache where possible, and the rest are sent to
+the LLM at most BATCH_LLM_CONCURRENCY at a time. A rate-limit error pauses
+every worker of the batch, for the server's Retry-After if it sent one and
+otherwise with exponential backoff plus jitter, before the call is retried.
+The generated SQL runs on a separate pool of BATCH_SQL_WORKERS threads so
+database work overlaps with the remaining LLM calls. One failing question
+only fails its own item.
+"""
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import execute_sql
+from openai_sql import nl_to_sql_with_understanding_async
+import translation_cache
+
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+BATCH_SQL_WORKERS = int(os.getenv("BATCH_SQL_WORKERS", "4"))
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "5"))
+BATCH_BACKOFF_BASE = float(os.getenv("BATCH_BACKOFF_BASE", "1.0"))
+BATCH_BACKOFF_MAX = float(os.getenv("BATCH_BACKOFF_MAX", "60"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+
+_sql_executor = ThreadPoolExecutor(max_workers=BATCH_SQL_WORKERS, thread_name_prefix="batch-sql")
+
+def is_rate_limit_error(error):
+    """True for the LLM's 429 / rate-limit errors, whichever SDK raised them"""
+    if type(error).__name__ == "RateLimitError":
+        return True
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    return status == 429
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said"""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class _Backoff:
+    """Pause shared by all workers of one batch after a rate-limit error"""
+
+    def __init__(self):
+        self.resume_at = 0.0
+
+    async def wait(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def hit(self, error, attempt):
+        delay = retry_after(error)
+        if delay is None:
+            delay = min(BATCH_BACKOFF_MAX, BATCH_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        self.resume_at = max(self.resume_at, time.monotonic() + delay)
+
+async def _translate(user_query, semaphore, backoff, max_retries, llm_mode):
+    async with semaphore:
+        for attempt in range(max_retries + 1):
+            await backoff.wait()
+            try:
+                return await nl_to_sql_with_understanding_async(user_query, llm_mode)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == max_retries:
+                    raise
+                backoff.hit(e, attempt)
+
+async def _run_one(user_query, semaphore, backoff, max_retries, result_format, llm_mode):
+    loop = asyncio.get_running_loop()
+    item = {"user_query": user_query}
+    try:
+        translation = await loop.run_in_executor(_sql_executor, translation_cache.lookup, user_query)
+        cached = translation is not None
+        if not cached:
+            translation = await _translate(user_query, semaphore, backoff, max_retries, llm_mode)
+    except Exception as e:
+        item["error"] = f"Translation failed: {e}"
+        return item
+    sql = translation["sql"]
+    result = await loop.run_in_executor(_sql_executor, execute_sql, sql, result_format)
+    if not cached and "error" not in result:
+        await loop.run_in_executor(_sql_executor, translation_cache.store, user_query, sql,
+                                   translation["understanding"])
+    elif cached and "error" in result:
+        await loop.run_in_executor(_sql_executor, translation_cache.discard, translation["cache_key"])
+    item.update({"sql": sql, "understanding": translation["understanding"],
+                 "result": result, "cached": cached, "llm_mode": translation.get("llm_mode")})
+    return item
+
+async def run_batch(questions, concurrency=BATCH_LLM_CONCURRENCY, max_retries=BATCH_MAX_RETRIES,
+                    result_format="rows", llm_mode=None):
+    """Translate and execute questions; returns one item per input question, in order"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    backoff = _Backoff()
+
+    # Repeats of a question are translated and run once. Questions that only normalize alike are
+    # left to the translation cache, which can tell whether they really share a translation
+    keys = []
+    first_index = {}
+    for index, user_query in enumerate(questions):
+        key = user_query.strip()
+        keys.append(key)
+        first_index.setdefault(key, index)
+
+    tasks = {key: asyncio.ensure_future(_run_one(questions[index], semaphore, backoff, max_retries,
+                                                    result_format, llm_mode))
+             for key, index in first_index.items()}
+    await asyncio.gather(*tasks.values())
+
+    items = []
+    for index, (user_query, key) in enumerate(zip(questions, keys)):
+        item = dict(tasks[key].result(), index=index, user_query=user_query)
+        item["duplicate_of"] = first_index[key] if first_index[key] != index else None
+        items.append(item)
+    return {
+        "items": items,
+        "total": len(questions),
+        "unique": len(first_index),
+        "failed": sum(1 for item in items if "error" in item or "error" in item.get("result", {})),
+    }
@@ -0,0 +1,53 @@
+"""Setup shared by the bench_*.py scripts.
+
+The benchmarks never touch genai.db: they run against a copy in a temporary
+directory, with the app tables kept in that copy too (even if a separate
+metadata database is configured), and with the fake LLM standing in for the
+API. These helpers only set environment variables, so call them before
+importing main or anything that reads its settings at import time.
+"""
+import os
+import shutil
+import tempfile
+
+def use_database_copy(db="genai.db", name="bench.db"):
+    """Point the app (data and app tables) at a copy of db; returns the temporary directory"""
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, name)
+    if db is not None:
+        shutil.copy(db, path)
+    os.environ["GENAI_DB_PATH"] = path
+    os.environ["GENAI_APP_DB_PATH"] = path
+    return tmpdir
+
+def use_fake_llm(delay=None):
+    os.environ["LLM_BACKEND"] = "fake"
+    if delay is not None:
+        os.environ["FAKE_LLM_DELAY"] = str(delay)
+
+def disable_background_work(translation_cache=False):
+    """Turn off the pin scheduler and the index advisor, whose background tasks would be counted
+    in the in-process request time, and the translation cache unless asked to keep it"""
+    os.environ["PIN_SCHEDULER_ENABLED"] = "0"
+    os.environ["INDEX_ADVISOR_ENABLED"] = "0"
+    if not translation_cache:
+        os.environ["TRANSLATION_CACHE_ENABLED"] = "0"
+
+def start_app(main):
+    """What the startup event would do; the ASGI transport doesn't run startup events"""
+    main.history_writer.writer.start()
+
+def stop_app(main, tmpdir):
+    main.history_writer.writer.stop()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+def load_questions(corpus):
+    with open(corpus) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
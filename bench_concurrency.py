@@ -0,0 +1,104 @@
+"""Concurrent-request scaling of the async /query handler versus a synchronous one.
+
+Drives main.app in-process (httpx ASGI transport) with the fake LLM and, at each
+concurrency level, sends the same questions to /query and to a synchronous
+copy of the handler as it was before the request path went async: a plain def
+that blocks a threadpool worker for both LLM calls and the SQLite work. The
+sync handler tops out at the size of the server's threadpool; the async one
+should keep scaling with the number of requests in flight.
+
+Usage:
+    python bench_concurrency.py --levels 1,8,32,64,128,256 --llm-delay 0.2
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bench_common import (use_database_copy, use_fake_llm, disable_background_work, start_app, stop_app,
+                          load_questions, percentile)
+
+def add_sync_route(main):
+    """Register the pre-async /query handler at /bench/sync_query"""
+    from datetime import datetime
+    from openai_sql import nl_to_sql_with_understanding
+    from pinning import save_query_history
+
+    def sync_query(q: main.Query):
+        result_with_understanding = nl_to_sql_with_understanding(q.user_query)
+        sql = result_with_understanding["sql"]
+        understanding = result_with_understanding["understanding"]
+        result = main.execute_sql(sql, "rows" if q.format == "rows" else "columnar")
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        save_query_history(timestamp, q.user_query, sql, understanding, None, None)
+        return {"sql": sql, "understanding": understanding, "result": result}
+
+    main.app.post("/bench/sync_query")(sync_query)
+
+async def load(app, path, questions, total, concurrency):
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(client, i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(path, json={"user_query": questions[i % len(questions)]})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200 or "error" in response.json().get("result", {}):
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(total)))
+        wall = time.perf_counter() - started
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": total / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="genai.db", help="database to copy and benchmark against")
+    parser.add_argument("--corpus", default="bench_questions.txt", help="one question per line")
+    parser.add_argument("--levels", default="1,8,32,64,128,256", help="comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=4, help="requests per level = rounds x concurrency")
+    parser.add_argument("--llm-delay", type=float, default=0.2, help="fake LLM round trip in seconds")
+    parser.add_argument("--output", default="bench_concurrency.json")
+    args = parser.parse_args()
+
+    tmpdir = use_database_copy(args.db)
+    use_fake_llm(args.llm_delay)
+    disable_background_work()
+
+    import main
+    add_sync_route(main)
+    start_app(main)
+
+    questions = load_questions(args.corpus)
+
+    results = []
+    print(f"fake LLM delay {args.llm_delay}s")
+    print(f"{'concurrency':>11} {'handler':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    for level in [int(level) for level in args.levels.split(",")]:
+        for handler, path in (("sync", "/bench/sync_query"), ("async", "/query")):
+            stats = asyncio.run(load(main.app, path, questions, level * args.rounds, level))
+            stats.update(concurrency=level, handler=handler)
+            results.append(stats)
+            print(f"{level:>11} {handler:>8} {stats['throughput_rps']:8.1f} {stats['p50_ms']:9.1f} "
+                  f"{stats['p95_ms']:9.1f} {stats['errors']:>7}")
+    stop_app(main, tmpdir)
+
+    with open(args.output, "w") as f:
+        json.dump({"llm_delay": args.llm_delay, "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    run()
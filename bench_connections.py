@@ -0,0 +1,62 @@
+"""Requests/sec on /query_history and /pins with and without connection pooling.
+
+Runs against a temporary copy of the database so the benchmark never touches
+genai.db. "unpooled" reproduces the old behaviour: a fresh connection with no
+PRAGMAs for every call.
+
+Usage: python bench_connections.py [--requests 2000] [--threads 8]
+"""
+import argparse
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_common import use_database_copy
+
+_tmpdir = use_database_copy()
+
+from fastapi.testclient import TestClient
+
+import connection_pool
+import main
+
+ENDPOINTS = ["/query_history", "/pins"]
+
+def requests_per_second(client, path, total, threads):
+    def hit(_):
+        assert client.get(path).status_code == 200
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(hit, range(min(total, 50))))  # warm up
+        start = time.perf_counter()
+        list(executor.map(hit, range(total)))
+    return total / (time.perf_counter() - start)
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    pool = connection_pool.get_pool()
+    client = TestClient(main.app)
+    configs = {
+        "unpooled": (0, []),
+        "pooled": (connection_pool.SQLITE_POOL_SIZE, connection_pool.PRAGMAS),
+    }
+
+    results = {}
+    for name, (max_idle, pragmas) in configs.items():
+        pool.close_all()
+        pool.max_idle, pool.pragmas = max_idle, list(pragmas)
+        for path in ENDPOINTS:
+            results[(name, path)] = requests_per_second(client, path, args.requests, args.threads)
+
+    print(f"{args.requests} requests per endpoint, {args.threads} client threads")
+    for path in ENDPOINTS:
+        before, after = results[("unpooled", path)], results[("pooled", path)]
+        print(f"{path:>15}: unpooled {before:8.1f} req/s | pooled {after:8.1f} req/s | {after / before:.2f}x")
+    shutil.rmtree(_tmpdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,50 @@
+"""Compare sequential vs concurrent NL→SQL generation against the fake LLM.
+
+Usage: python bench_llm.py [--delay 0.5] [--runs 5]
+"""
+import argparse
+import asyncio
+import time
+
+from bench_common import use_fake_llm
+
+use_fake_llm()
+
+import fake_llm
+import openai_sql
+
+QUESTION = "List top 3 customers by purchase amount"
+
+def sequential(user_query):
+    """The original behaviour: understanding call, then SQL call"""
+    understanding = openai_sql.complete(openai_sql.build_understanding_prompt(user_query))
+    sql = openai_sql.extract_sql(openai_sql.complete(openai_sql.build_sql_prompt(user_query)))
+    return {"understanding": understanding, "sql": sql}
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=fake_llm.FAKE_LLM_DELAY)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    fake_llm.ChatCompletion.delay = args.delay
+
+    results = {
+        "sequential": timed(lambda: sequential(QUESTION), args.runs),
+        "threaded": timed(lambda: openai_sql.nl_to_sql_with_understanding(QUESTION), args.runs),
+        "asyncio": timed(lambda: asyncio.run(openai_sql.nl_to_sql_with_understanding_async(QUESTION)), args.runs),
+    }
+
+    print(f"Fake LLM delay: {args.delay:.3f}s, runs: {args.runs}")
+    for name, seconds in results.items():
+        speedup = results["sequential"] / seconds
+        print(f"{name:>10}: {seconds * 1000:8.1f} ms/question  ({speedup:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Payload size and client decode time of the row, columnar and Arrow result formats.
+
+Loads schema.sql + sample_data.sql into a temporary database, runs a query over
+every order and measures what the Streamlit side would receive and do: decode
+the body and build a pandas DataFrame.
+
+Usage: python bench_payload.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+import pandas as pd
+
+from bench_common import use_database_copy
+
+QUERY = """SELECT O.order_id, C.name AS customer_name, P.name AS product_name, P.category,
+       O.order_date, O.quantity, O.total_amount
+FROM "Order" AS O
+JOIN Customer AS C ON O.customer_id = C.customer_id
+JOIN Product AS P ON O.product_id = P.product_id"""
+
+def build_database(path):
+    """Sample tables without schema.sql's seed rows, which clash with sample_data.sql"""
+    with open("schema.sql") as f:
+        schema = f.read().split("-- Sample Data")[0]
+    with open("sample_data.sql") as f:
+        sample_data = f.read()
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    conn.executescript(sample_data)
+    conn.commit()
+    conn.close()
+
+def best_of(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = use_database_copy(None)
+    build_database(os.environ["GENAI_DB_PATH"])
+
+    import result_format
+    from db import execute_sql
+
+    rows_result = execute_sql(QUERY, "rows")
+    columnar_result = execute_sql(QUERY, "columnar")
+    bodies = {
+        "rows": json.dumps(rows_result).encode(),
+        "columnar": json.dumps(columnar_result).encode(),
+    }
+    decoders = {
+        "rows": lambda body: pd.DataFrame(json.loads(body)["rows"]),
+        "columnar": lambda body: (lambda r: pd.DataFrame(dict(zip(r["columns"], r["data"]))))(json.loads(body)),
+    }
+    if result_format.pa is not None:
+        pa = result_format.pa
+        bodies["arrow"] = result_format.to_arrow_ipc(columnar_result)
+        decoders["arrow"] = lambda body: pa.ipc.open_stream(body).read_all().to_pandas()
+    else:
+        print("pyarrow not installed; skipping the Arrow format")
+
+    print(f"{len(rows_result['rows'])} rows x {len(rows_result['columns'])} columns, best of {args.runs}")
+    baseline_size = len(bodies["rows"])
+    baseline_time = best_of(lambda: decoders["rows"](bodies["rows"]), args.runs)
+    for name, body in bodies.items():
+        decode_time = best_of(lambda: decoders[name](body), args.runs)
+        print(f"{name:>9}: {len(body) / 1024:9.1f} KiB ({len(body) / baseline_size:5.2f}x)"
+              f" | decode + DataFrame {decode_time * 1000:7.1f} ms ({decode_time / baseline_time:5.2f}x)")
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,192 @@
+"""End-to-end benchmark of the /query pipeline with the fake LLM.
+
+Drives main.app in-process (httpx ASGI transport, no network), replays a corpus
+of questions and reports p50/p95/p99 latency and throughput, broken down into
+prompt build, LLM wait, SQL execution, history write and serialization. Runs
+against a temporary copy of the database; results are written as JSON so runs
+can be compared (pass --baseline with an earlier file to print the deltas,
+including the tokens per request saved).
+
+Usage:
+    python bench_query.py --requests 200 --concurrency 8 --llm-delay 0.05
+    python bench_query.py --db load_test.db --output after.json --baseline before.json
+    python bench_query.py --llm-mode single --output single.json --baseline before.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import subprocess
+import time
+from datetime import datetime
+
+from bench_common import (use_database_copy, use_fake_llm, disable_background_work, start_app, stop_app,
+                          load_questions, percentile)
+
+STAGES = ["prompt_build", "llm_wait", "sql_execution", "history_write", "serialization"]
+
+_stages = contextvars.ContextVar("bench_stages", default=None)
+
+def _add(stage, seconds):
+    stages = _stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+def timed(stage, fn):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _add(stage, time.perf_counter() - start)
+    return wrapper
+
+def timed_async(stage, fn):
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _add(stage, time.perf_counter() - start)
+    return wrapper
+
+def instrument(main, openai_sql):
+    """Wrap each pipeline stage with a timer that reports into the current request's context"""
+    import fastapi.routing
+    import starlette.responses
+
+    for name in ("build_understanding_prompt", "build_sql_prompt", "build_combined_prompt"):
+        setattr(openai_sql, name, timed("prompt_build", getattr(openai_sql, name)))
+    # The table lookup runs on the SQLite executor, which sees the request's context
+    openai_sql.schema_catalog.relevant_tables = timed("prompt_build", openai_sql.schema_catalog.relevant_tables)
+    # Wall time of the (concurrent) LLM calls; prompt building is subtracted afterwards
+    main.nl_to_sql_with_understanding_async = timed_async("llm_total", main.nl_to_sql_with_understanding_async)
+    main.execute_sql = timed("sql_execution", main.execute_sql)
+    main.fetch_page = timed("sql_execution", main.fetch_page)
+    main.traced_save_query_history = timed("history_write", main.traced_save_query_history)
+    fastapi.routing.serialize_response = timed_async("serialization", fastapi.routing.serialize_response)
+    render = starlette.responses.JSONResponse.render
+    starlette.responses.JSONResponse.render = timed("serialization", render)
+
+def summarize(values):
+    return {
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+    }
+
+async def replay(app, questions, total, concurrency, payload):
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    errors = 0
+
+    async def one(client, i):
+        nonlocal errors
+        async with semaphore:
+            stages = {}
+            _stages.set(stages)
+            start = time.perf_counter()
+            response = await client.post("/query", json=dict(payload, user_query=questions[i % len(questions)]))
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200 or "error" in response.json().get("result", {}):
+                errors += 1
+            stages["llm_wait"] = max(stages.pop("llm_total", 0.0) - stages.get("prompt_build", 0.0), 0.0)
+            samples.append((elapsed, stages))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(total)))
+        wall = time.perf_counter() - started
+    return samples, errors, wall
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="genai.db", help="database to copy and benchmark against")
+    parser.add_argument("--corpus", default="bench_questions.txt", help="one question per line")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="fake LLM round trip in seconds")
+    parser.add_argument("--page-size", type=int, help="send page_size with every /query")
+    parser.add_argument("--format", default="rows", help="result format sent with every /query")
+    parser.add_argument("--llm-mode", default="two_call", help="llm_mode sent with every /query (two_call or single)")
+    parser.add_argument("--cache", action="store_true", help="leave the translation cache enabled")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    tmpdir = use_database_copy(args.db)
+    use_fake_llm(args.llm_delay)
+    disable_background_work(translation_cache=args.cache)
+
+    import main
+    import openai_sql
+    import tracing
+    instrument(main, openai_sql)
+    start_app(main)
+
+    questions = load_questions(args.corpus)
+    payload = {"format": args.format, "llm_mode": args.llm_mode}
+    if args.page_size:
+        payload["page_size"] = args.page_size
+
+    tokens_before = tracing.token_totals()
+    samples, errors, wall = asyncio.run(replay(main.app, questions, args.requests, args.concurrency, payload))
+    stop_app(main, tmpdir)
+    tokens = {kind: (count - tokens_before[kind]) / max(len(samples), 1)
+              for kind, count in tracing.token_totals().items()}
+
+    results = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": git_commit(),
+        "config": {key: getattr(args, key) for key in ("db", "corpus", "requests", "concurrency",
+                                                       "llm_delay", "page_size", "format", "llm_mode",
+                                                       "cache")},
+        "requests": len(samples),
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_rps": len(samples) / wall if wall else 0.0,
+        "latency": summarize([elapsed for elapsed, _ in samples]),
+        "tokens_per_request": tokens,
+        "stages": {stage: summarize([stages.get(stage, 0.0) for _, stages in samples]) for stage in STAGES},
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # e.g. a --llm-mode single run against a two_call baseline
+        before = baseline.get("tokens_per_request")
+        if before and before["prompt"] + before["completion"]:
+            results["token_savings_vs_baseline"] = (
+                1 - (tokens["prompt"] + tokens["completion"]) / (before["prompt"] + before["completion"]))
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{results['requests']} requests, concurrency {args.concurrency}, fake LLM delay {args.llm_delay}s, "
+          f"{errors} errors")
+    print(f"throughput: {results['throughput_rps']:.1f} req/s")
+    line = f"tokens/request: {tokens['prompt']:.0f} prompt, {tokens['completion']:.0f} completion"
+    if "token_savings_vs_baseline" in results:
+        line += f"   {results['token_savings_vs_baseline']:.1%} fewer than baseline ({baseline['config'].get('llm_mode', 'two_call')})"
+    print(line)
+    rows = [("total", results["latency"], baseline and baseline["latency"])]
+    rows += [(stage, results["stages"][stage], baseline and baseline["stages"].get(stage)) for stage in STAGES]
+    print(f"{'stage':>15} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats, before in rows:
+        line = f"{name:>15} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f}"
+        if before and before["p50_ms"]:
+            line += f"   p50 {stats['p50_ms'] / before['p50_ms']:.2f}x vs baseline"
+        print(line)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    run()
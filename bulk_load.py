@@ -0,0 +1,282 @@
+"""Fast bulk loader for SQL dumps, CSV and Parquet files.
+
+INSERT statements are parsed in Python and written with executemany in large
+transactions instead of being run one statement at a time. While loading, the
+indexes of every table being filled are dropped and recreated at the end (as are
+the result cache's per-row change-counter triggers, whose counter is bumped once
+instead), and durability PRAGMAs are relaxed. A database the app has open (WAL)
+can be loaded while it runs.
+
+Usage:
+    python bulk_load.py --schema schema.sql --replace sample_data.sql
+    python bulk_load.py --db load_test.db --table Order orders.csv
+    python bulk_load.py --db load_test.db orders.parquet      # table from the file name
+"""
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from connection_pool import DB_PATH
+import result_cache
+
+BATCH_SIZE = 50000
+COMMIT_EVERY = 1000000
+
+INSERT_PATTERN = re.compile(
+    r'^\s*INSERT\s+(?:OR\s+\w+\s+)?INTO\s+(?:"([^"]+)"|`([^`]+)`|\[([^\]]+)\]|(\w+))\s*'
+    r'(?:\(([^)]*)\))?\s*VALUES\s*(.*?);?\s*$',
+    re.IGNORECASE | re.DOTALL,
+)
+TRANSACTION_PATTERN = re.compile(r"^\s*(BEGIN|COMMIT|END|ROLLBACK)\b", re.IGNORECASE)
+VALUE_TOKEN = re.compile(
+    r"'(?:[^']|'')*'|NULL\b|[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?|[(),]|\s+",
+    re.IGNORECASE,
+)
+
+def _literal(token):
+    if token[0] == "'":
+        return token[1:-1].replace("''", "'")
+    if token.upper() == "NULL":
+        return None
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+def parse_values(text):
+    """Parse the tuples after VALUES into lists of Python values; None if it isn't plain literals"""
+    tokens = VALUE_TOKEN.findall(text)
+    if sum(map(len, tokens)) != len(text):
+        # Something other than literals (a function call, an expression, ...)
+        return None
+    rows, row = [], None
+    expect_value = False
+    for token in tokens:
+        if token == "(":
+            if row is not None:
+                return None
+            row, expect_value = [], True
+        elif token == ")":
+            if row is None or expect_value:
+                return None
+            rows.append(row)
+            row = None
+        elif token == ",":
+            if row is not None and expect_value:
+                return None
+            expect_value = row is not None
+        elif token.isspace():
+            continue
+        elif row is None or not expect_value:
+            return None
+        else:
+            row.append(_literal(token))
+            expect_value = False
+    return rows if row is None else None
+
+def iter_statements(f):
+    """Split a SQL file into statements, keeping semicolons inside string literals"""
+    buffer = []
+    quotes = 0
+    for line in f:
+        if not buffer and (not line.strip() or line.lstrip().startswith("--")):
+            continue
+        buffer.append(line)
+        quotes += line.count("'")
+        if quotes % 2 == 0 and line.rstrip().endswith(";"):
+            yield "".join(buffer)
+            buffer, quotes = [], 0
+    if buffer and "".join(buffer).strip():
+        yield "".join(buffer)
+
+@contextmanager
+def relaxed_pragmas(conn):
+    """Trade durability for speed for the duration of a load
+
+    A database in WAL mode (the app switches every file it opens to WAL) may be open in the app,
+    and leaving WAL or locking it exclusively would fail with "database is locked", so it stays in
+    WAL with syncing off and readers keep working during the load. Any other database is loaded
+    with an in-memory journal under an exclusive lock, which is taken up front so that a file
+    someone else has open fails right away rather than partway through.
+    """
+    conn.execute("PRAGMA busy_timeout = 5000")
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    wal = journal_mode.lower() == "wal"
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if not wal:
+        try:
+            conn.execute("PRAGMA journal_mode = MEMORY")
+            conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+            conn.execute("BEGIN EXCLUSIVE")
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            conn.execute("PRAGMA locking_mode = NORMAL")
+            raise SystemExit(f"The database is in use by another connection ({e}); "
+                                "stop the app or load into another file") from e
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.commit()
+        if not wal:
+            conn.execute("PRAGMA locking_mode = NORMAL")
+            conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+class BulkLoader:
+    """Buffers rows per table and writes them with executemany in large transactions"""
+
+    def __init__(self, conn, batch_size=BATCH_SIZE, commit_every=COMMIT_EVERY, replace=False):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.verb = "INSERT OR REPLACE" if replace else "INSERT"
+        self.pending = {}
+        self.uncommitted = 0
+        self.counts = {}
+        self.dropped_indexes = {}
+        self.dropped_triggers = set()
+
+    def _defer_indexes(self, table):
+        """Drop the table's indexes the first time it receives rows; finish() rebuilds them"""
+        if table in self.dropped_indexes:
+            return
+        indexes = self.conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table,),
+        ).fetchall()
+        for name, _ in indexes:
+            self.conn.execute(f'DROP INDEX "{name}"')
+        self.dropped_indexes[table] = [sql for _, sql in indexes]
+        if result_cache.drop_triggers(self.conn, table):
+            self.dropped_triggers.add(table)
+
+    def add_rows(self, table, columns, rows):
+        """Queue rows (sequences of values) for table; columns may be None for positional values"""
+        self._defer_indexes(table)
+        key = (table, tuple(columns) if columns else None)
+        buffer = self.pending.setdefault(key, [])
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= self.batch_size:
+                self._write(key)
+                buffer = self.pending.setdefault(key, [])
+
+    def _write(self, key):
+        rows = self.pending.pop(key, [])
+        if not rows:
+            return
+        table, columns = key
+        column_sql = " (" + ", ".join(f'"{c}"' for c in columns) + ")" if columns else ""
+        placeholders = ", ".join("?" * len(rows[0]))
+        self.conn.executemany(f'{self.verb} INTO "{table}"{column_sql} VALUES ({placeholders})', rows)
+        self.counts[table] = self.counts.get(table, 0) + len(rows)
+        self.uncommitted += len(rows)
+        if self.uncommitted >= self.commit_every:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def flush(self):
+        for key in list(self.pending):
+            self._write(key)
+
+    def execute(self, statement):
+        """Run a statement that isn't a plain INSERT, after everything queued before it"""
+        self.flush()
+        self.conn.execute(statement)
+
+    def finish(self):
+        """Write what's left, commit and rebuild the deferred indexes and triggers"""
+        self.flush()
+        self.conn.commit()
+        for statements in self.dropped_indexes.values():
+            for sql in statements:
+                self.conn.execute(sql)
+        for table in self.dropped_triggers:
+            result_cache.install_triggers(self.conn, table)
+            result_cache.bump_version(self.conn, table)
+        self.conn.commit()
+        self.dropped_indexes = {}
+        self.dropped_triggers = set()
+        return self.counts
+
+def _columns(column_list):
+    if not column_list:
+        return None
+    return [c.strip().strip('"`[]') for c in column_list.split(",")]
+
+def load_sql(loader, path):
+    with open(path, encoding="utf-8") as f:
+        for statement in iter_statements(f):
+            if TRANSACTION_PATTERN.match(statement):
+                # The loader manages its own transactions
+                continue
+            match = INSERT_PATTERN.match(statement)
+            rows = parse_values(match.group(6)) if match else None
+            if rows:
+                table = next(g for g in match.groups()[:4] if g is not None)
+                loader.add_rows(table, _columns(match.group(5)), rows)
+            else:
+                loader.execute(statement)
+
+def load_csv(loader, path, table):
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        # Empty fields become NULL; column affinity turns numeric text back into numbers
+        loader.add_rows(table, columns, ([value if value != "" else None for value in row] for row in reader))
+
+def load_parquet(loader, path, table):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet input requires pyarrow (pip install pyarrow)")
+    parquet_file = pq.ParquetFile(path)
+    columns = parquet_file.schema_arrow.names
+    for batch in parquet_file.iter_batches(batch_size=loader.batch_size):
+        loader.add_rows(table, columns, zip(*(column.to_pylist() for column in batch.columns)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load SQL, CSV or Parquet files into SQLite")
+    parser.add_argument("inputs", nargs="+", help=".sql, .csv or .parquet files")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: GENAI_DB_PATH or genai.db)")
+    parser.add_argument("--schema", help="SQL script to run before loading, e.g. schema.sql")
+    parser.add_argument("--table", help="target table for CSV/Parquet inputs (default: file name)")
+    parser.add_argument("--replace", action="store_true", help="use INSERT OR REPLACE for duplicate keys")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--commit-every", type=int, default=COMMIT_EVERY)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    start = time.perf_counter()
+    with relaxed_pragmas(conn):
+        if args.schema:
+            with open(args.schema, encoding="utf-8") as f:
+                conn.executescript(f.read())
+        loader = BulkLoader(conn, args.batch_size, args.commit_every, args.replace)
+        for path in args.inputs:
+            extension = os.path.splitext(path)[1].lower()
+            table = args.table or os.path.splitext(os.path.basename(path))[0]
+            if extension == ".csv":
+                load_csv(loader, path, table)
+            elif extension == ".parquet":
+                load_parquet(loader, path, table)
+            else:
+                load_sql(loader, path)
+        counts = loader.finish()
+    conn.close()
+
+    elapsed = time.perf_counter() - start
+    total = sum(counts.values())
+    for table, count in counts.items():
+        print(f"{table:>20}: {count:,} rows")
+    print(f"Loaded {total:,} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} rows/sec)")
+
+if __name__ == "__main__":
+    main()
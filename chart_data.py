@@ -0,0 +1,125 @@
+"""Server-side reduction of query results for charts.
+
+/chart_data wraps a query's SQL so SQLite returns only what the chart draws:
+- bar and pie charts: y is summed per x category, the largest categories are
+  kept (CHART_BAR_CATEGORIES for bars, CHART_PIE_CATEGORIES for pies, counting
+  the "Other" slice) and the rest are folded into one "Other" row, labelled
+  "Other (2)", "Other (3)", ... if a kept category is itself called "Other";
+- line charts: the points, ordered by x, are split into equal-sized buckets
+  and each bucket keeps its lowest and highest point, so at most
+  CHART_MAX_POINTS points come back and spikes survive the downsampling.
+The rows that reach the browser are bounded by those settings rather than by
+the size of the result, and the wrapped query runs in the sandbox (and goes
+through the result cache) like any other.
+"""
+import os
+
+from db import execute_sql, iter_sql
+from result_format import column_type, reshape_result
+
+CHART_BAR_CATEGORIES = int(os.getenv("CHART_BAR_CATEGORIES", "15"))
+CHART_PIE_CATEGORIES = int(os.getenv("CHART_PIE_CATEGORIES", "8"))
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "2000"))
+
+OTHER_LABEL = "Other"
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _subquery(sql):
+    # The newline keeps a trailing -- comment from swallowing the closing parenthesis
+    return f"({sql.strip().rstrip(';')}\n)"
+
+def top_n_sql(sql, x, y, categories):
+    """y summed per x, largest first, with everything past the first categories - 1 summed into one
+    row whose folded column is 1 and x NULL (a category can be NULL too, so folded tells them apart)"""
+    qx, qy = _quote(x), _quote(y)
+    return f"""
+    WITH totals AS (
+        SELECT {qx} AS x, SUM({qy}) AS y, COUNT(*) AS source_rows FROM {_subquery(sql)} GROUP BY {qx}
+    ), ranked AS (
+        SELECT x, y, source_rows,
+               ROW_NUMBER() OVER (ORDER BY y DESC) AS rank, COUNT(*) OVER () AS categories
+        FROM totals
+    ), folded AS (
+        SELECT *, NOT (categories <= {categories} OR rank < {categories}) AS folded FROM ranked
+    )
+    SELECT CASE WHEN folded THEN NULL ELSE x END AS {qx},
+           SUM(y) AS {qy}, SUM(SUM(source_rows)) OVER () AS source_rows, folded
+    FROM folded
+    GROUP BY folded, 1
+    ORDER BY MIN(rank)
+    """
+
+def other_label(labels):
+    """OTHER_LABEL, or the first "Other (n)" that isn't one of the labels"""
+    label, n = OTHER_LABEL, 1
+    while label in labels:
+        n += 1
+        label = f"{OTHER_LABEL} ({n})"
+    return label
+
+def _label_folded(data):
+    """Put a label on the folded row of a top_n_sql result that no real category has"""
+    labels, folded = data[0], data[3]
+    if any(folded):
+        label = other_label({str(value) for value, is_folded in zip(labels, folded) if not is_folded})
+        data[0] = [label if is_folded else value for value, is_folded in zip(labels, folded)]
+
+def downsample_sql(sql, x, y, max_points):
+    """The lowest and highest point of each of max_points / 2 buckets of consecutive x"""
+    qx, qy = _quote(x), _quote(y)
+    # A bare column next to MIN()/MAX() takes its value from the row holding the extreme,
+    # so each bucket contributes the actual points rather than made-up ones
+    return f"""
+    WITH points AS (
+        SELECT {qx} AS x, {qy} AS y FROM {_subquery(sql)} WHERE {qy} IS NOT NULL
+    ), buckets AS (
+        SELECT x, y, NTILE({max(1, max_points // 2)}) OVER (ORDER BY x) AS bucket, COUNT(*) OVER () AS source_rows
+        FROM points
+    )
+    SELECT x AS {qx}, y AS {qy}, source_rows FROM (
+        SELECT x, MIN(y) AS y, source_rows FROM buckets GROUP BY bucket
+        UNION
+        SELECT x, MAX(y) AS y, source_rows FROM buckets GROUP BY bucket
+    )
+    ORDER BY 1
+    """
+
+def columns_of(sql):
+    """Column names of a query's result, without fetching any rows"""
+    batches = iter_sql(f"SELECT * FROM {_subquery(sql)} LIMIT 0")
+    try:
+        return next(batches)
+    finally:
+        batches.close()
+
+def reduce_for_chart(sql, chart_type, x, y, limit=None, format="rows"):
+    """Chart-ready rows of sql's full result: [x, y] plus how many source rows they summarize"""
+    if chart_type == "line":
+        reduced_sql = downsample_sql(sql, x, y, limit or CHART_MAX_POINTS)
+    elif chart_type in ("bar", "pie"):
+        default = CHART_BAR_CATEGORIES if chart_type == "bar" else CHART_PIE_CATEGORIES
+        reduced_sql = top_n_sql(sql, x, y, max(2, limit or default))
+    else:
+        return {"error": f"Unsupported chart type for reduction: {chart_type}"}
+    try:
+        columns = columns_of(sql)
+    except Exception as e:
+        return {"error": str(e)}
+    # An unknown name in double quotes would silently become a string literal
+    missing = [name for name in (x, y) if name not in columns]
+    if missing:
+        return {"error": f"No such column in the result: {', '.join(missing)}"}
+
+    result = execute_sql(reduced_sql, "columnar")
+    if "error" in result:
+        return result
+    data, types = result["data"], result["types"]
+    if chart_type != "line":
+        _label_folded(data)
+        types = [column_type(data[0])] + types[1:]
+    source_rows = data[2][0] if data[2] else 0
+    result = {"columns": result["columns"][:2], "types": types[:2], "data": data[:2]}
+    result["source_rows"] = source_rows
+    return reshape_result(result, format)
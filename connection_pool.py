@@ -0,0 +1,113 @@
+"""Shared pool of SQLite connections.
+
+Opening a connection costs a file open, schema parse and a cold page cache, so
+db.py and pinning.py check connections out of a per-database pool instead of
+calling sqlite3.connect on every request. PRAGMAs are applied once, when a
+connection is created, and idle connections are handed out most-recently-used
+first so FastAPI's threadpool workers keep getting warm ones. Read-only pools
+(used by sandbox.py) open the file with a mode=ro URI, so their connections
+can't write whatever SQL they are given.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = os.getenv("GENAI_DB_PATH", "genai.db")
+# The app's own tables (pins, query history, translation cache, index advisor stats). Pointing this
+# at a separate file keeps their writes from contending with analytical reads of DB_PATH and puts
+# them out of reach of generated SQL; migrate_app_db.py moves existing tables over.
+APP_DB_PATH = os.getenv("GENAI_APP_DB_PATH", DB_PATH)
+
+# Idle connections kept per database; 0 disables pooling
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "16"))
+
+PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", os.getenv("SQLITE_CACHE_SIZE", "-20000")),  # negative = KiB, so ~20 MB
+    ("mmap_size", os.getenv("SQLITE_MMAP_SIZE", "268435456")),
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", "5000"),
+]
+
+# Settings that need write access are left to the read-write pool
+READ_ONLY_PRAGMAS = [(name, value) for name, value in PRAGMAS if name not in ("journal_mode", "synchronous")]
+
+class ConnectionPool:
+    def __init__(self, path, max_idle=SQLITE_POOL_SIZE, pragmas=None, read_only=False):
+        self.path = path
+        self.max_idle = max_idle
+        self.read_only = read_only
+        if pragmas is None:
+            pragmas = READ_ONLY_PRAGMAS if read_only else PRAGMAS
+        self.pragmas = list(pragmas)
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self):
+        if self.read_only:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self.lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        with self.lock:
+            self.reused += 1
+        return conn
+
+    def release(self, conn):
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        if self.idle.qsize() < self.max_idle:
+            self.idle.put(conn)
+        else:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Check a connection out for the duration of a with-block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return {"path": self.path, "read_only": self.read_only, "idle": self.idle.qsize(), "opened": self.opened, "reused": self.reused}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path=None, read_only=False):
+    """Return the shared pool for a database file (DB_PATH by default)"""
+    path = path or DB_PATH
+    with _pools_lock:
+        if (path, read_only) not in _pools:
+            _pools[path, read_only] = ConnectionPool(path, read_only=read_only)
+        return _pools[path, read_only]
+
+def get_app_pool():
+    """Return the shared pool for the application metadata database (APP_DB_PATH)"""
+    return get_pool(APP_DB_PATH)
@@ -1,26 +1,139 @@
-import sqlite3
+import os
+import json
+import base64
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import sandbox
+import result_cache
+from result_format import shape_result
+from tracing import span
 
-def get_connection():
-    return sqlite3.connect("genai.db", check_same_thread=False)
+# Rows pulled from SQLite per fetchmany call when streaming
+FETCH_BATCH_SIZE = int(os.getenv("SQL_FETCH_BATCH_SIZE", "1000"))
 
-def execute_sql(query):
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row  # Set row factory to return row objects
-    cursor = conn.cursor()
+# Threads for SQLite work started from async handlers. Sized like the connection pool, since more
+# threads than connections only queue on the database; kept apart from the HTTP threadpool so slow
+# queries can't starve other work of threads
+SQL_THREADS = int(os.getenv("SQL_THREADS", os.getenv("SQLITE_POOL_SIZE", "16")))
+# Largest page fetch_page serves; a page is held in memory whole, like an execute_sql result
+MAX_PAGE_SIZE = sandbox.SQL_MAX_ROWS
+
+_db_executor = ThreadPoolExecutor(max_workers=max(1, SQL_THREADS), thread_name_prefix="sqlite")
+
+def run_db(fn, *args):
+    """Await a blocking database call on the SQLite executor, keeping the caller's trace"""
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(_db_executor, context.run, fn, *args)
+
+def iter_sql(query, batch_size=FETCH_BATCH_SIZE, timeout=sandbox.SQL_TIMEOUT_SECONDS, tables=None):
+    """Execute a query in the sandbox, yield its column names, then lists of row tuples"""
+    with sandbox.connection(timeout, tables) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query)
+            yield [desc[0] for desc in cursor.description]
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            # Finalize the statement even if the consumer stopped early
+            cursor.close()
+
+def execute_sql(query, format="rows", max_rows=sandbox.SQL_MAX_ROWS):
+    """Execute a query and return up to max_rows rows in the given payload format"""
+    cacheable = result_cache.is_cacheable(query)
+    if cacheable:
+        cache_key = (result_cache.normalize_sql(query), max_rows)
+        cached = result_cache.lookup(cache_key)
+        if cached is not None:
+            cols, rows, truncated = cached
+            with span("row_conversion"):
+                result = shape_result(cols, rows, format)
+            if truncated:
+                result["truncated"] = True
+            return result
+        # Taken before running the query, so a write committed meanwhile makes the entry stale
+        versions = result_cache.current_versions()
+    tables = set()
     try:
-        cursor.execute(query)
-        cols = [desc[0] for desc in cursor.description]
-        
-        # Convert rows to dictionaries with column names
-        rows = []
-        for row in cursor.fetchall():
-            row_dict = {}
-            for i, col in enumerate(cols):
-                row_dict[col] = row[i]
-            rows.append(row_dict)
-            
-        return {"columns": cols, "rows": rows}
+        with span("db_execute"):
+            batches = iter_sql(query, batch_size=min(FETCH_BATCH_SIZE, max_rows + 1), tables=tables)
+            cols = next(batches)
+            # Stop fetching one row past the cap, which is enough to know there was more
+            rows = []
+            for batch in batches:
+                rows.extend(batch)
+                if len(rows) > max_rows:
+                    break
+            batches.close()
+        truncated = len(rows) > max_rows
+        rows = rows[:max_rows]
+        with span("row_conversion"):
+            result = shape_result(cols, rows, format)
+        if truncated:
+            result["truncated"] = True
+        if cacheable:
+            result_cache.store(cache_key, tables, versions, cols, rows, truncated)
+        return result
     except Exception as e:
         return {"error": str(e)}
-    finally:
-        conn.close()
+
+def fetch_page(query, offset=0, page_size=100, format="rows"):
+    """Execute a query and return one page of rows starting at offset"""
+    # A page of 0 rows would always report has_more and never advance; negative sizes would be unlimited
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        return {"error": f"page_size must be between 1 and {MAX_PAGE_SIZE}"}
+    if offset < 0:
+        return {"error": "offset must not be negative"}
+    try:
+        with span("db_execute"):
+            batches = iter_sql(query, batch_size=page_size + 1)
+            cols = next(batches)
+
+            # Skip rows from earlier pages a batch at a time instead of materializing them
+            rows = []
+            skipped = 0
+            for batch in batches:
+                if skipped + len(batch) <= offset:
+                    skipped += len(batch)
+                    continue
+                rows.extend(batch[max(offset - skipped, 0):])
+                skipped += len(batch)
+                if len(rows) > page_size:
+                    break
+            batches.close()
+
+        with span("row_conversion"):
+            result = shape_result(cols, rows[:page_size], format)
+        result["offset"] = offset
+        result["has_more"] = len(rows) > page_size
+        return result
+    except Exception as e:
+        return {"error": str(e)}
+
+def encode_page_token(query, offset):
+    """Opaque continuation token for the page of query starting at offset"""
+    payload = json.dumps({"sql": query, "offset": offset}).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+def decode_page_token(token):
+    """Return (query, offset) from a continuation token"""
+    payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+    offset = int(payload["offset"])
+    if offset < 0:
+        raise ValueError("Negative offset in page token")
+    return payload["sql"], offset
+
+def stream_ndjson(query):
+    """Yield a query's full result as NDJSON: a columns line, then one object per row"""
+    try:
+        batches = iter_sql(query, timeout=sandbox.SQL_EXPORT_TIMEOUT_SECONDS)
+        cols = next(batches)
+        yield json.dumps({"columns": cols}) + "\n"
+        for batch in batches:
+            yield "".join(json.dumps(dict(zip(cols, row))) + "\n" for row in batch)
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
@@ -0,0 +1,125 @@
+"""Offline stand-in for openai.ChatCompletion.
+
+Select it with LLM_BACKEND=fake. Every call sleeps for FAKE_LLM_DELAY seconds
+to simulate the API round trip (spread over the pieces when streaming), then
+answers deterministically from keywords in the question so the generated SQL
+runs against the sample schema.
+"""
+import os
+import json
+import re
+import asyncio
+import time
+from types import SimpleNamespace
+
+FAKE_LLM_DELAY = float(os.getenv("FAKE_LLM_DELAY", "0.5"))
+
+# (keyword, SQL) pairs checked in order against the lower-cased question
+CANNED_SQL = [
+    ("month", """SELECT strftime('%Y-%m', O.order_date) AS month, SUM(O.total_amount) AS total_sales
+FROM "Order" AS O
+GROUP BY month
+ORDER BY month;"""),
+    ("categor", """SELECT P.category, SUM(O.total_amount) AS total_sales
+FROM "Order" AS O
+JOIN Product AS P ON O.product_id = P.product_id
+GROUP BY P.category
+ORDER BY total_sales DESC;"""),
+    ("product", """SELECT P.name AS product_name, SUM(O.quantity) AS units_sold, SUM(O.total_amount) AS total_sales
+FROM "Order" AS O
+JOIN Product AS P ON O.product_id = P.product_id
+GROUP BY P.name
+ORDER BY total_sales DESC
+LIMIT 10;"""),
+    ("customer", """SELECT C.name, SUM(O.total_amount) AS total_spent
+FROM Customer AS C
+JOIN "Order" AS O ON C.customer_id = O.customer_id
+GROUP BY C.name
+ORDER BY total_spent DESC
+LIMIT 10;"""),
+]
+
+DEFAULT_SQL = """SELECT O.order_id, C.name AS customer_name, P.name AS product_name, O.order_date, O.quantity, O.total_amount
+FROM "Order" AS O
+JOIN Customer AS C ON O.customer_id = C.customer_id
+JOIN Product AS P ON O.product_id = P.product_id
+ORDER BY O.order_date DESC
+LIMIT 50;"""
+
+def _question(prompt):
+    """The user's question is the last quoted Query: line in every prompt"""
+    matches = re.findall(r'Query: "(.*)"', prompt)
+    return matches[-1] if matches else prompt
+
+def canned_sql(question):
+    question = question.lower()
+    for keyword, sql in CANNED_SQL:
+        if keyword in question:
+            return sql
+    return DEFAULT_SQL
+
+def answer(prompt):
+    """Produce the reply text the real model would be expected to give"""
+    question = _question(prompt)
+    if "Respond with ONLY a JSON object" in prompt:
+        return json.dumps({"understanding": _understanding(question), "sql": canned_sql(question)})
+    if "Convert this natural language query" in prompt:
+        return f"```sql\n{canned_sql(question)}\n```"
+    return _understanding(question)
+
+def _understanding(question):
+    return (f"You're asking: {question}. "
+            "This will be answered from the Customer, Product and \"Order\" tables.")
+
+def _response(content, prompt):
+    prompt_tokens = len(prompt.split())
+    completion_tokens = len(content.split())
+    return SimpleNamespace(
+        choices=[SimpleNamespace(
+            message=SimpleNamespace(role="assistant", content=content),
+            finish_reason="stop",
+        )],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        ),
+    )
+
+def _chunk(piece):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece), finish_reason=None)])
+
+class ChatCompletion:
+    """Mimics the parts of openai.ChatCompletion the app uses (create and acreate)"""
+    delay = FAKE_LLM_DELAY
+
+    @classmethod
+    def create(cls, model=None, messages=None, stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        if stream:
+            return cls._stream(answer(prompt))
+        time.sleep(cls.delay)
+        return _response(answer(prompt), prompt)
+
+    @classmethod
+    async def acreate(cls, model=None, messages=None, stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        if stream:
+            return cls._astream(answer(prompt))
+        await asyncio.sleep(cls.delay)
+        return _response(answer(prompt), prompt)
+
+    @classmethod
+    async def _astream(cls, content):
+        pieces = re.findall(r"\S+\s*", content)
+        for piece in pieces:
+            await asyncio.sleep(cls.delay / len(pieces))
+            yield _chunk(piece)
+
+    @classmethod
+    def _stream(cls, content):
+        # The round trip is spread over the pieces, so the first one arrives well before the last
+        pieces = re.findall(r"\S+\s*", content)
+        for piece in pieces:
+            time.sleep(cls.delay / len(pieces))
+            yield _chunk(piece)
@@ -0,0 +1,196 @@
+"""Deterministic synthetic data for the Customer / Product / "Order" schema.
+
+Generates any number of orders with realistic skew: a few customers place most
+orders, product popularity is Zipfian and order dates follow weekly and
+holiday seasonality. Rows are produced in batches and written straight into
+SQLite through bulk_load.BulkLoader, so memory stays bounded by the batch size
+plus one 8-byte weight per customer and product, even at tens of millions of
+orders. The same --seed always produces the same database.
+
+Usage:
+    python generate_data.py --db load_test.db --orders 1000000 --seed 42
+"""
+import argparse
+import sqlite3
+import time
+from array import array
+from datetime import date, timedelta
+from itertools import accumulate
+from math import gcd
+from random import Random
+
+from bulk_load import BulkLoader, relaxed_pragmas, BATCH_SIZE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Customer (
+    customer_id INTEGER PRIMARY KEY,
+    name TEXT,
+    email TEXT
+);
+
+CREATE TABLE IF NOT EXISTS Product (
+    product_id INTEGER PRIMARY KEY,
+    name TEXT,
+    category TEXT,
+    price REAL
+);
+
+CREATE TABLE IF NOT EXISTS "Order" (
+    order_id INTEGER PRIMARY KEY,
+    customer_id INTEGER,
+    product_id INTEGER,
+    order_date DATE,
+    quantity INTEGER,
+    total_amount REAL
+);
+"""
+
+# Same id ranges as sample_data.sql
+FIRST_PRODUCT_ID = 1001
+FIRST_ORDER_ID = 5001
+
+FIRST_NAMES = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda",
+               "William", "Elizabeth", "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+               "Thomas", "Sarah", "Charles", "Karen", "Daniel", "Nancy", "Matthew", "Lisa",
+               "Anthony", "Betty", "Mark", "Margaret", "Samuel", "Amelia", "Benjamin", "Olivia"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+              "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+              "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson",
+              "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson", "Walker"]
+EMAIL_DOMAINS = ["example.com", "demo.com", "testmail.com", "mail.com"]
+
+# category: (nouns, median price)
+CATEGORIES = {
+    "Electronics": (["Phone", "Laptop", "Headphones", "Watch", "Tablet", "Camera", "Speaker"], 450.0),
+    "Books": (["Novel", "Cookbook", "Guide", "Biography", "Atlas", "Textbook"], 25.0),
+    "Fashion": (["Jacket", "Sneakers", "Dress", "Scarf", "Backpack", "Sunglasses"], 80.0),
+    "Home": (["Lamp", "Blender", "Chair", "Rug", "Kettle", "Vacuum"], 120.0),
+    "Sports": (["Bike", "Racket", "Yoga Mat", "Dumbbells", "Tent", "Helmet"], 90.0),
+    "Toys": (["Puzzle", "Robot", "Board Game", "Doll", "Drone", "Blocks"], 35.0),
+}
+ADJECTIVES = ["Smart", "Advanced", "Classic", "Ultra", "Eco", "Pro", "Compact", "Deluxe",
+              "Essential", "Premium", "Portable", "Vintage"]
+
+# Relative order volume by month (holiday peak, January slump) and by weekday (Mon..Sun)
+MONTH_WEIGHTS = [0.8, 0.85, 0.95, 0.95, 1.0, 1.0, 0.95, 1.05, 1.0, 1.1, 1.45, 1.8]
+WEEKDAY_WEIGHTS = [0.9, 0.95, 0.95, 1.0, 1.1, 1.3, 1.2]
+
+QUANTITIES = [1, 2, 3, 4, 5]
+QUANTITY_WEIGHTS = [60, 22, 10, 5, 3]
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative Zipf weights for ranks 1..n, stored compactly"""
+    return array("d", accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+def rank_to_id(n, seed):
+    """A cheap bijection from popularity rank to id, so the hottest rows aren't simply the lowest ids"""
+    step = Random(seed).randrange(1, n) if n > 1 else 1
+    while gcd(step, n) != 1:
+        step += 1
+    offset = Random(seed + 1).randrange(n)
+    return lambda rank: (rank * step + offset) % n
+
+def generate_customers(rng, count):
+    for customer_id in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        email = f"{first.lower()}.{last.lower()}{customer_id}@{rng.choice(EMAIL_DOMAINS)}"
+        yield (customer_id, f"{first} {last}", email)
+
+def generate_products(rng, count, prices):
+    """Yields product rows, recording each price in prices for computing order totals"""
+    categories = list(CATEGORIES)
+    for i in range(count):
+        category = rng.choice(categories)
+        nouns, median_price = CATEGORIES[category]
+        price = round(median_price * rng.lognormvariate(0, 0.6), 2)
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(nouns)}"
+        if count > len(ADJECTIVES) * 6:
+            name += f" {i // (len(ADJECTIVES) * 6) + 1}"
+        prices.append(price)
+        yield (FIRST_PRODUCT_ID + i, name, category, price)
+
+def day_cum_weights(start, end, rng):
+    """Per-day weights with monthly and weekly seasonality, a mild growth trend and noise"""
+    days = (end - start).days + 1
+    weights = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        trend = 1.0 + 0.3 * offset / max(days - 1, 1)
+        weights.append(MONTH_WEIGHTS[day.month - 1] * WEEKDAY_WEIGHTS[day.weekday()] * trend
+                       * rng.uniform(0.9, 1.1))
+    return days, array("d", accumulate(weights))
+
+def generate_orders(rng, count, customers, prices, start, end, batch_size,
+                    customer_skew=1.0, product_skew=1.1):
+    """Yields batches of order rows"""
+    products = len(prices)
+    customer_weights = zipf_cum_weights(customers, customer_skew)
+    product_weights = zipf_cum_weights(products, product_skew)
+    customer_id_of = rank_to_id(customers, rng.randrange(1 << 30))
+    product_index_of = rank_to_id(products, rng.randrange(1 << 30))
+    days, date_weights = day_cum_weights(start, end, rng)
+    dates = [(start + timedelta(days=offset)).isoformat() for offset in range(days)]
+    customer_ranks, product_ranks, day_offsets = range(customers), range(products), range(days)
+
+    order_id = FIRST_ORDER_ID
+    remaining = count
+    while remaining > 0:
+        k = min(batch_size, remaining)
+        batch_customers = rng.choices(customer_ranks, cum_weights=customer_weights, k=k)
+        batch_products = rng.choices(product_ranks, cum_weights=product_weights, k=k)
+        batch_days = rng.choices(day_offsets, cum_weights=date_weights, k=k)
+        batch_quantities = rng.choices(QUANTITIES, weights=QUANTITY_WEIGHTS, k=k)
+        rows = []
+        for customer_rank, product_rank, day, quantity in zip(batch_customers, batch_products,
+                                                              batch_days, batch_quantities):
+            product_index = product_index_of(product_rank)
+            # Occasional discounts so totals aren't always price x quantity
+            discount = 0.9 if rng.random() < 0.1 else 1.0
+            rows.append((order_id, customer_id_of(customer_rank) + 1, FIRST_PRODUCT_ID + product_index,
+                         dates[day], quantity, round(prices[product_index] * quantity * discount, 2)))
+            order_id += 1
+        remaining -= k
+        yield rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Customer/Product/Order dataset")
+    parser.add_argument("--db", default="load_test.db")
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--customers", type=int, help="default: orders / 10")
+    parser.add_argument("--products", type=int, help="default: orders / 100, between 100 and 100000")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start-date", default="2023-01-01")
+    parser.add_argument("--end-date", default="2024-12-31")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--replace", action="store_true", help="drop existing Customer/Product/Order tables first")
+    args = parser.parse_args()
+
+    customers = args.customers or max(args.orders // 10, 1)
+    products = args.products or min(max(args.orders // 100, 100), 100000)
+    start, end = date.fromisoformat(args.start_date), date.fromisoformat(args.end_date)
+    rng = Random(args.seed)
+
+    conn = sqlite3.connect(args.db)
+    started = time.perf_counter()
+    with relaxed_pragmas(conn):
+        if args.replace:
+            conn.executescript('DROP TABLE IF EXISTS Customer; DROP TABLE IF EXISTS Product; DROP TABLE IF EXISTS "Order";')
+        conn.executescript(SCHEMA)
+        loader = BulkLoader(conn, batch_size=args.batch_size)
+
+        loader.add_rows("Customer", None, generate_customers(rng, customers))
+        prices = array("d")
+        loader.add_rows("Product", None, generate_products(rng, products, prices))
+        for rows in generate_orders(rng, args.orders, customers, prices, start, end, args.batch_size):
+            loader.add_rows("Order", None, rows)
+        counts = loader.finish()
+    conn.close()
+
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    for table, count in counts.items():
+        print(f"{table:>10}: {count:,} rows")
+    print(f"Generated {total:,} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} rows/sec)")
+
+if __name__ == "__main__":
+    main()
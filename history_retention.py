@@ -0,0 +1,74 @@
+"""Background retention for QueryHistory.
+
+A daemon thread wakes up every HISTORY_RETENTION_TICK seconds and moves the
+entries older than HISTORY_RETENTION_DAYS into QueryHistoryArchive, in chunks
+of HISTORY_ARCHIVE_CHUNK rows per transaction so the writer lock is never held
+for long and /query's history inserts keep flowing in between. The live table,
+and with it the full-text index, stays at the size of the retention window.
+Retention is off unless HISTORY_RETENTION_DAYS is set: archived entries no
+longer show up in /query_history or its search.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+
+from pinning import archive_query_history
+
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", "0"))
+HISTORY_RETENTION_TICK = float(os.getenv("HISTORY_RETENTION_TICK", "3600"))
+HISTORY_ARCHIVE_CHUNK = int(os.getenv("HISTORY_ARCHIVE_CHUNK", "5000"))
+
+class HistoryRetention:
+    def __init__(self, days=HISTORY_RETENTION_DAYS, tick=HISTORY_RETENTION_TICK, chunk_size=HISTORY_ARCHIVE_CHUNK):
+        self.days = days
+        self.tick = tick
+        self.chunk_size = chunk_size
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats = {"archived": 0, "runs": 0, "last_run": None}
+
+    def start(self):
+        if self.thread is not None or self.days <= 0:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="history-retention", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.tick)
+            self.thread = None
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.archive_expired()
+            except Exception as e:
+                print(f"[WARN] History retention run failed: {e}")
+            self.stop_event.wait(self.tick)
+
+    def archive_expired(self):
+        """Archive every entry older than the retention window; returns how many were moved"""
+        cutoff = (datetime.now() - timedelta(days=self.days)).strftime("%Y-%m-%d %H:%M:%S")
+        total = 0
+        while not self.stop_event.is_set():
+            moved = archive_query_history(cutoff, self.chunk_size)
+            total += moved
+            if moved < self.chunk_size:
+                break
+        with self.lock:
+            self.stats["archived"] += total
+            self.stats["runs"] += 1
+            self.stats["last_run"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return total
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["retention_days"] = self.days
+        stats["running"] = self.thread is not None
+        return stats
+
+retention = HistoryRetention()
@@ -0,0 +1,118 @@
+"""Write-behind queue for QueryHistory inserts.
+
+/query hands its history row to HistoryWriter.submit, which only puts it on a
+bounded in-process queue. A daemon thread drains the queue, compressing the
+result snapshots and inserting everything that arrived within
+HISTORY_FLUSH_INTERVAL seconds (at most HISTORY_BATCH_SIZE rows) in a single
+transaction, so a burst of questions costs one commit instead of one each.
+
+When the queue is full, submit blocks for up to HISTORY_ENQUEUE_TIMEOUT
+seconds and then writes the row itself, so a stalled writer slows requests
+down rather than losing history. stop() writes whatever is still queued.
+Without a running writer (HISTORY_WRITE_BEHIND=0, scripts) rows are written
+synchronously.
+"""
+import os
+import queue
+import threading
+
+from pinning import save_query_history, save_query_history_batch
+from tracing import span
+
+HISTORY_WRITE_BEHIND = os.getenv("HISTORY_WRITE_BEHIND", "1") == "1"
+HISTORY_QUEUE_SIZE = int(os.getenv("HISTORY_QUEUE_SIZE", "10000"))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "500"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.05"))
+HISTORY_ENQUEUE_TIMEOUT = float(os.getenv("HISTORY_ENQUEUE_TIMEOUT", "1.0"))
+
+_STOP = object()
+
+class HistoryWriter:
+    def __init__(self, max_queued=HISTORY_QUEUE_SIZE, batch_size=HISTORY_BATCH_SIZE,
+                 flush_interval=HISTORY_FLUSH_INTERVAL):
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "overflow_writes": 0, "failed": 0}
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Write everything still queued and stop the writer thread"""
+        if self.thread is None:
+            return
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.thread = None
+
+    def submit(self, timestamp, user_query, sql_query, understanding, data=None, timings=None):
+        """Queue a history row; written synchronously if there is no writer or the queue stays full"""
+        row = (timestamp, user_query, sql_query, understanding, data, timings)
+        if self.thread is not None:
+            try:
+                self.queue.put(row, timeout=HISTORY_ENQUEUE_TIMEOUT)
+                with self.lock:
+                    self.stats["queued"] += 1
+                return
+            except queue.Full:
+                with self.lock:
+                    self.stats["overflow_writes"] += 1
+        save_query_history(*row)
+
+    def flush(self):
+        """Block until every row queued so far has been written"""
+        if self.thread is not None:
+            self.queue.join()
+
+    def _run(self):
+        stopping = False
+        while not (stopping and self.queue.empty()):
+            batch = []
+            taken = 0
+            item = self.queue.get()
+            # Collect whatever else arrives within the flush interval, up to a batch
+            while True:
+                taken += 1
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    # Once stopping, only drain what is already queued
+                    item = self.queue.get_nowait() if stopping else self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in range(taken):
+                self.queue.task_done()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            with span("history_flush"):
+                save_query_history_batch(batch)
+            with self.lock:
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+        except Exception as e:
+            print(f"[WARN] Writing {len(batch)} history rows failed: {e}")
+            with self.lock:
+                self.stats["failed"] += len(batch)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["pending"] = self.queue.qsize()
+        stats["running"] = self.thread is not None
+        return stats
+
+writer = HistoryWriter()
@@ -0,0 +1,197 @@
+"""Index advisor for LLM-generated SQL.
+
+Every generated query is run through EXPLAIN QUERY PLAN. For each table the
+plan scans in full, the columns the query filters or joins that table on are
+counted in IndexAdvisorStats. Columns that keep causing scans become index
+candidates: /index_advisor lists them, and with INDEX_ADVISOR_AUTO_CREATE=1 an
+index is created once a column reaches INDEX_ADVISOR_THRESHOLD scans.
+"""
+import math
+import os
+import re
+from datetime import datetime
+
+from connection_pool import get_pool, get_app_pool
+
+INDEX_ADVISOR_ENABLED = os.getenv("INDEX_ADVISOR_ENABLED", "1") == "1"
+INDEX_ADVISOR_THRESHOLD = int(os.getenv("INDEX_ADVISOR_THRESHOLD", "10"))
+INDEX_ADVISOR_AUTO_CREATE = os.getenv("INDEX_ADVISOR_AUTO_CREATE", "0") == "1"
+
+IDENT = r'(?:"([^"]+)"|`([^`]+)`|\[([^\]]+)\]|(\w+))'
+TABLE_REF_PATTERN = re.compile(rf"\b(?:FROM|JOIN)\s+{IDENT}(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+COLUMN_REF = rf"(?:{IDENT}\s*\.\s*)?{IDENT}"
+OPERATOR = r"(?:==|=|<>|!=|<=|>=|<|>|\bLIKE\b|\bGLOB\b|\bIN\b|\bBETWEEN\b|\bIS\b)"
+PREDICATE_PATTERNS = [
+    re.compile(rf"{COLUMN_REF}\s*(?:NOT\s+)?{OPERATOR}", re.IGNORECASE),
+    re.compile(rf"(?:==|=|<>|!=|<=|>=|<|>)\s*{COLUMN_REF}(?!\w)(?!\s*\()", re.IGNORECASE),
+]
+SQL_KEYWORDS = {"where", "join", "on", "left", "right", "inner", "outer", "cross", "natural",
+                "full", "group", "order", "limit", "using", "union", "having", "window", "except",
+                "intersect"}
+
+def setup_index_advisor():
+    with get_app_pool().connection() as conn:
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS IndexAdvisorStats (
+            table_name TEXT,
+            column_name TEXT,
+            scan_count INTEGER DEFAULT 0,
+            last_seen TEXT,
+            PRIMARY KEY (table_name, column_name)
+        )
+        """)
+        conn.commit()
+
+def _ident(groups):
+    return next((g for g in groups if g is not None), None)
+
+def _table_columns(conn):
+    """{table: {column: is_rowid_alias}} for every user table"""
+    tables = {}
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"):
+        columns = {}
+        for _, col, col_type, _, _, pk in conn.execute(f'PRAGMA table_info("{name}")'):
+            columns[col] = pk == 1 and col_type.upper() == "INTEGER"
+        tables[name] = columns
+    return tables
+
+def _aliases(sql, tables):
+    """Map every name a table is referred to by in the query (alias or own name) to the table"""
+    lookup = {name.lower(): name for name in tables}
+    aliases = {}
+    for match in TABLE_REF_PATTERN.finditer(sql):
+        table = lookup.get(_ident(match.groups()[:4]).lower())
+        if table is None:
+            continue
+        aliases[table.lower()] = table
+        alias = match.group(5)
+        if alias and alias.lower() not in SQL_KEYWORDS:
+            aliases[alias.lower()] = table
+    return aliases
+
+def _predicate_columns(sql, aliases, tables):
+    """(table, column) pairs used in comparisons, resolved through aliases"""
+    referenced = set(aliases.values())
+    found = set()
+    for pattern in PREDICATE_PATTERNS:
+        for match in pattern.finditer(sql):
+            qualifier, column = _ident(match.groups()[:4]), _ident(match.groups()[4:8])
+            if column is None:
+                continue
+            if qualifier is not None:
+                table = aliases.get(qualifier.lower())
+                candidates = [table] if table and column in tables[table] else []
+            else:
+                candidates = [t for t in referenced if column in tables[t]]
+            if len(candidates) == 1:
+                found.add((candidates[0], column))
+    return found
+
+def _scanned_tables(conn, sql, aliases):
+    """Tables the query plan reads in full"""
+    scanned = set()
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+        match = re.fullmatch(r"SCAN (\S+)", row[3])
+        if match and match.group(1).lower() in aliases:
+            scanned.add(aliases[match.group(1).lower()])
+    return scanned
+
+def _indexed_columns(conn, table):
+    """Columns that already lead some index on table"""
+    indexed = set()
+    for index in conn.execute(f'PRAGMA index_list("{table}")'):
+        info = conn.execute(f'PRAGMA index_info("{index[1]}")').fetchall()
+        if info:
+            indexed.add(info[0][2])
+    return indexed
+
+def _index_statement(table, column):
+    name = re.sub(r"\W", "_", f"idx_auto_{table}_{column}")
+    return f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ("{column}")'
+
+def _create_indexes(columns):
+    """Index each (table, column) that isn't indexed yet; a failure is logged, never raised"""
+    with get_pool().connection() as conn:
+        for table, column in columns:
+            try:
+                if column not in _indexed_columns(conn, table):
+                    conn.execute(_index_statement(table, column))
+                    conn.commit()
+                    print(f"[INFO] Index advisor created an index on {table}.{column}")
+            except Exception as e:
+                print(f"[WARN] Index advisor could not index {table}.{column}: {e}")
+
+def record(sql):
+    """Analyze one generated query; returns the (table, column) pairs that caused scans"""
+    if not INDEX_ADVISOR_ENABLED:
+        return []
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with get_pool().connection() as conn:
+        try:
+            tables = _table_columns(conn)
+            aliases = _aliases(sql, tables)
+            scanned = _scanned_tables(conn, sql, aliases)
+        except Exception:
+            # Not something the planner accepts; nothing to learn from it
+            return []
+        candidates = sorted(
+            (table, column) for table, column in _predicate_columns(sql, aliases, tables)
+            if table in scanned and not tables[table][column]
+        )
+    # The counters live with the app metadata, the indexes with the data. The counters are
+    # committed before any index is built: both may be in the same file, where CREATE INDEX
+    # would otherwise wait on the open counter transaction until it gave up
+    due = []
+    with get_app_pool().connection() as app_conn:
+        for table, column in candidates:
+            scan_count = app_conn.execute("""
+            INSERT INTO IndexAdvisorStats (table_name, column_name, scan_count, last_seen)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT (table_name, column_name)
+            DO UPDATE SET scan_count = scan_count + 1, last_seen = excluded.last_seen
+            RETURNING scan_count
+            """, (table, column, timestamp)).fetchone()[0]
+            if INDEX_ADVISOR_AUTO_CREATE and scan_count >= INDEX_ADVISOR_THRESHOLD:
+                due.append((table, column))
+        app_conn.commit()
+    if due:
+        _create_indexes(due)
+    return candidates
+
+def _estimated_rows(conn, table):
+    # MAX(rowid) is a B-tree seek, unlike COUNT(*) which reads the whole table
+    try:
+        return conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+    except Exception:
+        return 0
+
+def get_candidates(min_scans=1):
+    """Columns that caused full scans, most expensive first, with the index that would avoid them"""
+    with get_app_pool().connection() as app_conn:
+        stats = app_conn.execute("""
+        SELECT table_name, column_name, scan_count, last_seen
+        FROM IndexAdvisorStats
+        WHERE scan_count >= ?
+        """, (min_scans,)).fetchall()
+    with get_pool().connection() as conn:
+        report = []
+        indexed = {}
+        for table, column, scan_count, last_seen in stats:
+            if table not in indexed:
+                indexed[table] = _indexed_columns(conn, table)
+            rows = _estimated_rows(conn, table)
+            report.append({
+                "table": table,
+                "column": column,
+                "scans": scan_count,
+                "last_seen": last_seen,
+                "indexed": column in indexed[table],
+                "estimated_rows": rows,
+                # Rows read by the scans so far vs roughly log2(rows) per lookup with an index
+                "estimated_rows_scanned": scan_count * rows,
+                "estimated_rows_with_index": scan_count * max(1, math.ceil(math.log2(rows + 1))),
+                "over_threshold": scan_count >= INDEX_ADVISOR_THRESHOLD,
+                "recommendation": _index_statement(table, column),
+            })
+    report.sort(key=lambda item: (item["indexed"], -item["estimated_rows_scanned"]))
+    return report
@@ -1,8 +1,24 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from db import execute_sql
-from openai_sql import nl_to_sql_with_understanding
-from pinning import setup_pinning, save_pin, get_pins, update_pin, save_query_history, get_query_history
+import asyncio
+import json
+from typing import List, Literal, Optional
+from fastapi import FastAPI, BackgroundTasks, Query as QueryParam
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from db import run_db, execute_sql, fetch_page, MAX_PAGE_SIZE, encode_page_token, decode_page_token, stream_ndjson
+from result_format import to_arrow_ipc, arrow_metadata, reshape_result, ARROW_MEDIA_TYPE
+from openai_sql import nl_to_sql_with_understanding_async, generate_sql_async, stream_understanding, prompt_tables_async
+from pinning import setup_pinning, save_pin, get_pin, get_pins_with_results, update_pin, get_query_history, search_query_history, get_query_history_entry
+from pin_scheduler import scheduler, refresh_pin, PIN_SCHEDULER_ENABLED
+import translation_cache
+import result_cache
+import schema_catalog
+import batch
+import chart_data
+import index_advisor
+import tracing
+import history_writer
+from history_retention import retention
+from snapshots import HISTORY_SNAPSHOTS_ENABLED
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
@@ -14,15 +30,76 @@ app.add_middleware(
     allow_headers=["*"],
 )
 setup_pinning()
+translation_cache.setup_translation_cache()
+result_cache.setup_result_cache()
+# Introspect the schema for the prompts now rather than on the first question
+schema_catalog.get_catalog()
+index_advisor.setup_index_advisor()
+
+@app.on_event("startup")
+def start_pin_scheduler():
+    if PIN_SCHEDULER_ENABLED:
+        scheduler.start()
+
+@app.on_event("startup")
+def start_history_writer():
+    if history_writer.HISTORY_WRITE_BEHIND:
+        history_writer.writer.start()
+
+@app.on_event("startup")
+def start_history_retention():
+    retention.start()
+
+@app.on_event("shutdown")
+def stop_pin_scheduler():
+    scheduler.stop()
+
+@app.on_event("shutdown")
+def stop_history_writer():
+    # Writes the rows still queued
+    history_writer.writer.stop()
+
+@app.on_event("shutdown")
+def stop_history_retention():
+    retention.stop()
 
 class Query(BaseModel):
     user_query: str
+    # When set, only the first page_size rows are returned along with a continuation token
+    page_size: Optional[int] = Field(None, ge=1, le=MAX_PAGE_SIZE)
+    # "rows" (default), "columnar" or "arrow"; see result_format.py
+    format: str = "rows"
+    # "two_call" or "single" (one JSON reply); defaults to LLM_MODE
+    llm_mode: Optional[Literal["two_call", "single"]] = None
+
+class BatchQuery(BaseModel):
+    questions: List[str]
+    # Overrides BATCH_LLM_CONCURRENCY for this batch
+    concurrency: Optional[int] = None
+    # "rows" (default) or "columnar"
+    format: str = "rows"
+    llm_mode: Optional[Literal["two_call", "single"]] = None
+
+class ExportRequest(BaseModel):
+    sql: str
+
+class ChartDataRequest(BaseModel):
+    sql: str
+    # "bar", "pie" or "line"
+    chart_type: str = "bar"
+    x: str
+    y: str
+    # Categories (bar, pie) or points (line) to return; defaults to CHART_BAR_CATEGORIES, CHART_PIE_CATEGORIES, CHART_MAX_POINTS
+    limit: Optional[int] = None
+    # "rows" (default) or "columnar"
+    format: str = "rows"
 
 class PinRequest(BaseModel):
     user_query: str
     sql_query: str
     understanding: str = ""
     chart_type: str = "table"
+    refresh_interval: Optional[int] = None
 
 class HistoryRequest(BaseModel):
     timestamp: str
@@ -31,42 +108,246 @@ class HistoryRequest(BaseModel):
     understanding: str = ""
 
 @app.post("/query")
-def run_query(q: Query):
-    result_with_understanding = nl_to_sql_with_understanding(q.user_query)
+async def run_query(q: Query, background_tasks: BackgroundTasks):
+    trace = tracing.start_trace()
+    # Serve repeated questions from the translation cache instead of the LLM
+    result_with_understanding = await run_db(translation_cache.lookup, q.user_query)
+    cached = result_with_understanding is not None
+    if not cached:
+        # Both LLM calls are awaited concurrently on the async client; blocking SQLite work runs on the SQLite executor
+        result_with_understanding = await nl_to_sql_with_understanding_async(q.user_query, q.llm_mode)
     sql = result_with_understanding["sql"]
     understanding = result_with_understanding["understanding"]
-    result = execute_sql(sql)
+    llm_mode = result_with_understanding.get("llm_mode")
+    trace.llm_mode = llm_mode
+    result_format = "rows" if q.format == "rows" else "columnar"
+    if q.page_size:
+        result = await run_db(fetch_page, sql, 0, q.page_size, result_format)
+        with_page_token(result, sql, q.page_size)
+    else:
+        result = await run_db(execute_sql, sql, result_format)
     
-    # Save to query history
+    # Only translations that actually ran are worth reusing, and one that stopped working isn't kept
+    if not cached and "error" not in result:
+        await run_db(translation_cache.store, q.user_query, sql, understanding)
+    elif cached and "error" in result:
+        await run_db(translation_cache.discard, result_with_understanding["cache_key"])
+    
+    # Check the plan for full scans after the response has been sent
+    if "error" not in result:
+        background_tasks.add_task(index_advisor.record, sql)
+    
+    # Save to query history with a snapshot of the result, so replaying it needs neither the LLM nor the DB,
+    # and this request's timings (the row is queued; the batched insert shows up in /metrics as history_flush)
     from datetime import datetime
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    save_query_history(timestamp, q.user_query, sql, understanding)
+    tracing.finish_trace(trace, result)
+    # A first page or a truncated result replayed as the whole result would silently drop rows
+    snapshot = result if HISTORY_SNAPSHOTS_ENABLED and is_complete(result) else None
+    await run_db(traced_save_query_history, timestamp, q.user_query, sql, understanding,
+                            snapshot, trace.to_dict())
+    
+    if q.format == "arrow" and "error" not in result:
+        # The Arrow stream carries the SQL, understanding and paging fields in its schema metadata
+        try:
+            body = to_arrow_ipc(result, arrow_metadata(result, sql=sql, understanding=understanding, cached=cached))
+        except RuntimeError as e:
+            return {"sql": sql, "understanding": understanding, "result": {"error": str(e)}, "cached": cached,
+                    "llm_mode": llm_mode}
+        return Response(content=body, media_type=ARROW_MEDIA_TYPE)
     
-    return {"sql": sql, "understanding": understanding, "result": result}
+    return {"sql": sql, "understanding": understanding, "result": result, "cached": cached, "llm_mode": llm_mode}
+
+# Rows sent in the result event of /query/stream when the request has no page_size
+STREAM_PAGE_SIZE = 500
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def stream_query(q: Query):
+    # Server-sent events: "understanding" deltas as the model writes them, then "sql", then the
+    # first page of rows as "result", then "done" ("error" instead if the LLM call fails)
+    return StreamingResponse(query_events(q), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def query_events(q):
+    trace = tracing.start_trace()
+    translation = await run_db(translation_cache.lookup, q.user_query)
+    cached = translation is not None
+    if cached:
+        sql, understanding = translation["sql"], translation["understanding"]
+        yield sse("understanding", {"delta": understanding})
+    else:
+        # The SQL call runs while the understanding streams in
+        # Both prompts describe the same tables, looked up once off the event loop
+        try:
+            tables = await prompt_tables_async(q.user_query)
+        except Exception as e:
+            yield sse("error", {"error": f"Schema lookup failed: {e}"})
+            return
+        sql_task = asyncio.ensure_future(generate_sql_async(q.user_query, tables))
+        pieces = []
+        try:
+            async for piece in stream_understanding(q.user_query, tables):
+                pieces.append(piece)
+                yield sse("understanding", {"delta": piece})
+            sql = await sql_task
+        except Exception as e:
+            yield sse("error", {"error": f"LLM request failed: {e}"})
+            return
+        finally:
+            # The client may have gone away mid-stream
+            sql_task.cancel()
+        understanding = "".join(pieces).strip()
+        trace.llm_mode = "two_call"
+    yield sse("sql", {"sql": sql, "understanding": understanding, "cached": cached})
+
+    page_size = q.page_size or STREAM_PAGE_SIZE
+    result = await run_db(fetch_page, sql, 0, page_size, "rows" if q.format == "rows" else "columnar")
+    with_page_token(result, sql, page_size)
+    yield sse("result", result)
+
+    if not cached and "error" not in result:
+        await run_db(translation_cache.store, q.user_query, sql, understanding)
+    elif cached and "error" in result:
+        await run_db(translation_cache.discard, translation["cache_key"])
+    from datetime import datetime
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    tracing.finish_trace(trace, result)
+    # Only a complete result can stand in for re-running the query
+    snapshot = result if HISTORY_SNAPSHOTS_ENABLED and is_complete(result) else None
+    await run_db(traced_save_query_history, timestamp, q.user_query, sql, understanding,
+                            snapshot, trace.to_dict())
+    yield sse("done", {})
+    if "error" not in result:
+        await run_db(index_advisor.record, sql)
+
+@app.post("/query/batch")
+async def run_query_batch(b: BatchQuery):
+    # Items come back in request order; a failed question has an "error" and doesn't fail the batch
+    if len(b.questions) > batch.BATCH_MAX_QUESTIONS:
+        return {"error": f"At most {batch.BATCH_MAX_QUESTIONS} questions per batch"}
+    return await batch.run_batch(b.questions, b.concurrency or batch.BATCH_LLM_CONCURRENCY,
+                                 result_format="rows" if b.format == "rows" else "columnar", llm_mode=b.llm_mode)
+
+def is_complete(result):
+    """Whether a result holds every row of its query, i.e. can stand in for running it again"""
+    return ("error" not in result and not result.get("has_more") and not result.get("next_page_token")
+            and not result.get("truncated"))
+
+def traced_save_query_history(timestamp, user_query, sql, understanding, snapshot, timings):
+    # Only queues the row; the history writer inserts it in a batch off the request path
+    with tracing.span("history_enqueue"):
+        return history_writer.writer.submit(timestamp, user_query, sql, understanding, snapshot, timings)
+
+def with_page_token(result, sql, page_size):
+    if result.get("has_more"):
+        result["next_page_token"] = encode_page_token(sql, result["offset"] + page_size)
+    else:
+        result["next_page_token"] = None
+    return result
+
+@app.get("/query/page")
+async def get_query_page(token: str, page_size: int = QueryParam(100, ge=1, le=MAX_PAGE_SIZE), format: str = "rows"):
+    try:
+        sql, offset = decode_page_token(token)
+    except Exception:
+        return {"error": "Invalid page token"}
+    result = await run_db(fetch_page, sql, offset, page_size, "rows" if format == "rows" else "columnar")
+    return {"sql": sql, "result": with_page_token(result, sql, page_size)}
+
+@app.post("/export")
+async def export_query(e: ExportRequest):
+    # Rows are streamed batch by batch, so memory stays flat however large the result is
+    return StreamingResponse(stream_ndjson(e.sql), media_type="application/x-ndjson")
+
+@app.post("/chart_data")
+async def get_chart_data(c: ChartDataRequest):
+    # Top-N + "Other" or min/max downsampling is done in SQL, so the response size doesn't grow with the result
+    result = await run_db(chart_data.reduce_for_chart, c.sql, c.chart_type, c.x, c.y, c.limit,
+                          "rows" if c.format == "rows" else "columnar")
+    return {"sql": c.sql, "result": result}
 
 @app.post("/pin")
-def pin_query(p: PinRequest):
-    save_pin(p.user_query, p.sql_query, p.chart_type)
-    return {"status": "pinned"}
+async def pin_query(p: PinRequest):
+    pin_id = await run_db(save_pin, p.user_query, p.sql_query, p.chart_type, p.refresh_interval)
+    # Materialize the first result right away so the Pinned Reports tab has something to show
+    scheduler.submit([pin_id])
+    return {"status": "pinned", "pin_id": pin_id}
 
 @app.get("/pins")
-def get_all_pins():
-    return get_pins()
+async def get_all_pins():
+    # Latest materialized results only; nothing is executed here
+    return await run_db(get_pins_with_results)
+
+@app.post("/pins/{pin_id}/run")
+async def run_pin(pin_id: int):
+    # Execute the SQL that was pinned rather than regenerating it from the question
+    pin = await run_db(get_pin, pin_id)
+    if pin is None:
+        return {"error": "Pin not found"}
+    return {"pin_id": pin_id, "sql": pin[2], "result": await run_db(refresh_pin, pin_id)}
 
 @app.post("/refresh_pin")
-def manually_refresh_pin(pin_id: int):
-    pins = get_pins()
-    for pin in pins:
-        if pin[0] == pin_id:
-            sql = pin[2]
-            result = execute_sql(sql)
-            return {"result": result}
-    return {"error": "Pin not found"}
+async def manually_refresh_pin(pin_id: int):
+    result = await run_db(refresh_pin, pin_id)
+    if result is None:
+        return {"error": "Pin not found"}
+    return {"result": result}
 
 @app.post("/refresh_all")
-def refresh_all_pins():
-    return {"status": "refresh started in background"}
+async def refresh_all_pins():
+    queued = await run_db(scheduler.refresh_all)
+    return {"status": "refresh started in background", "queued": queued}
 
 @app.get("/query_history")
-def get_history(limit: int = 50):
-    return get_query_history(limit)
+async def get_history(limit: int = QueryParam(50, ge=1, le=500), cursor: Optional[int] = None):
+    # Newest first; pass the returned next_cursor to get the following page (null on the last one)
+    return await run_db(get_query_history, limit, cursor)
+
+@app.get("/query_history/search")
+async def search_history(q: str, limit: int = QueryParam(50, ge=1, le=500), cursor: Optional[int] = None):
+    # Entries whose question, SQL or understanding contain every word of q, paged like /query_history
+    return await run_db(search_query_history, q, limit, cursor)
+
+@app.get("/query_history/retention")
+async def get_history_retention_stats():
+    return retention.get_stats()
+
+@app.get("/query_history/{history_id}")
+async def get_history_entry(history_id: int, reexecute: bool = False, format: str = "rows"):
+    # The stored snapshot is returned as is; reexecute=true runs the saved SQL again (never the LLM)
+    entry = await run_db(get_query_history_entry, history_id)
+    if entry is None:
+        return {"error": "History entry not found"}
+    snapshot = entry.pop("snapshot")
+    result_format = "rows" if format == "rows" else "columnar"
+    if snapshot is not None and not reexecute:
+        entry["result"] = reshape_result(snapshot, result_format)
+        entry["from_snapshot"] = True
+    else:
+        entry["result"] = await run_db(execute_sql, entry["sql"], result_format)
+        entry["from_snapshot"] = False
+    return entry
+
+@app.get("/index_advisor")
+async def get_index_candidates(min_scans: int = 1):
+    return await run_db(index_advisor.get_candidates, min_scans)
+
+@app.get("/translation_cache/stats")
+async def get_translation_cache_stats():
+    return await run_db(translation_cache.get_stats)
+
+@app.get("/history_writer/stats")
+async def get_history_writer_stats():
+    return history_writer.writer.get_stats()
+
+@app.get("/result_cache/stats")
+async def get_result_cache_stats():
+    return result_cache.get_stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition format
+    return Response(content=tracing.render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,95 @@
+"""Move the app's own tables out of the data database into a metadata database.
+
+Copies pins, pin results, query history (and its archive), the translation
+cache and the index advisor counters from the data database into the metadata
+database, where they are created the way the app creates them (indexes,
+full-text index and triggers included), then drops them from the data
+database. Ids are kept, so history and pin links stay valid. Rows already in
+the metadata database win, so an interrupted run can simply be repeated.
+
+Afterwards start the app with GENAI_APP_DB_PATH pointing at the new file.
+
+Usage:
+    python migrate_app_db.py --app-db genai_app.db
+    python migrate_app_db.py --data-db genai.db --app-db genai_app.db --keep --vacuum
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+# In copy order: PinResults references PinnedReports
+APP_METADATA_TABLES = ["PinnedReports", "PinResults", "QueryHistory", "QueryHistoryArchive",
+                       "TranslationCache", "IndexAdvisorStats"]
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info("{table}")')]
+
+def migrate(data_db, app_db, keep=False, vacuum=False):
+    # The setup functions create the tables in whatever APP_DB_PATH is at import time
+    os.environ["GENAI_DB_PATH"] = data_db
+    os.environ["GENAI_APP_DB_PATH"] = app_db
+    from pinning import setup_pinning
+    from translation_cache import setup_translation_cache
+    from index_advisor import setup_index_advisor
+    setup_pinning()
+    setup_translation_cache()
+    setup_index_advisor()
+
+    conn = sqlite3.connect(app_db)
+    conn.execute("ATTACH DATABASE ? AS data", (data_db,))
+    present = {row[0] for row in conn.execute("SELECT name FROM data.sqlite_master WHERE type = 'table'")}
+    moved = []
+    with conn:
+        for table in APP_METADATA_TABLES:
+            if table not in present:
+                continue
+            # Older data databases may lack columns added since; copy what both sides have
+            target = _columns(conn, "main", table)
+            columns = ", ".join(f'"{name}"' for name in _columns(conn, "data", table) if name in target)
+            # The triggers on QueryHistory index the copied rows for full-text search as they go in
+            count = conn.execute(
+                f'INSERT OR IGNORE INTO main."{table}" ({columns}) SELECT {columns} FROM data."{table}"'
+            ).rowcount
+            moved.append(table)
+            print(f"{table}: {count} rows copied")
+    conn.execute("DETACH DATABASE data")
+    conn.close()
+
+    if keep or not moved:
+        return moved
+    conn = sqlite3.connect(data_db)
+    with conn:
+        # Dropping QueryHistory drops its triggers; its full-text index goes separately
+        conn.execute("DROP TABLE IF EXISTS QueryHistoryFTS")
+        for table in reversed(moved):
+            conn.execute(f'DROP TABLE "{table}"')
+    print(f"Dropped {len(moved)} tables from {data_db}")
+    if vacuum:
+        conn.execute("VACUUM")
+    conn.close()
+    return moved
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-db", default=os.getenv("GENAI_DB_PATH", "genai.db"),
+                        help="database the tables are moved out of (default: GENAI_DB_PATH or genai.db)")
+    parser.add_argument("--app-db", default=os.getenv("GENAI_APP_DB_PATH"),
+                        help="metadata database to move them into (default: GENAI_APP_DB_PATH)")
+    parser.add_argument("--keep", action="store_true", help="copy only; leave the tables in the data database")
+    parser.add_argument("--vacuum", action="store_true", help="reclaim the freed space in the data database")
+    args = parser.parse_args()
+
+    if not args.app_db:
+        sys.exit("Pass --app-db or set GENAI_APP_DB_PATH")
+    if os.path.abspath(args.app_db) == os.path.abspath(args.data_db):
+        sys.exit("The metadata database must be a different file from the data database")
+    start = time.perf_counter()
+    moved = migrate(args.data_db, args.app_db, keep=args.keep, vacuum=args.vacuum)
+    print(f"{'Copied' if args.keep else 'Moved'} {len(moved)} tables to {args.app_db} "
+          f"in {time.perf_counter() - start:.1f}s; "
+          f"start the app with GENAI_APP_DB_PATH={args.app_db}")
+
+if __name__ == "__main__":
+    run()
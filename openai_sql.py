@@ -1,101 +1,294 @@
 import openai
 import os
 import re
+import json
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from tracing import span, record_tokens
+from db import run_db
+import schema_catalog
 
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def nl_to_sql_with_understanding(user_query):
-    """Convert natural language to SQL with understanding explanation"""
-    # First get the understanding of the query
-    understanding_prompt = f"""
-Database Schema (with all column names):
-Customer (customer_id INTEGER, name TEXT, email TEXT)
-Product (product_id INTEGER, name TEXT, category TEXT, price REAL)
-"Order" (order_id INTEGER, customer_id INTEGER, product_id INTEGER, order_date DATE, quantity INTEGER, total_amount REAL)
+MODEL = "gpt-4.1"
 
-For the following natural language query, explain in a short 2-3 sentence summary what the query is asking for.
-This explanation will be shown to the user to verify their query was understood correctly.
-Be clear about what tables and fields are involved and any filters or aggregations.
+# "openai" calls the real API, "fake" uses the offline stand-in in fake_llm.py
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+# "two_call" sends the understanding and SQL prompts separately, "single" asks for both in one JSON reply;
+# either can be chosen per request
+LLM_MODES = ("two_call", "single")
+LLM_MODE = os.getenv("LLM_MODE", "two_call")
+if LLM_MODE not in LLM_MODES:
+    raise ValueError(f"LLM_MODE must be one of {', '.join(LLM_MODES)}, got {LLM_MODE!r}")
+
+JSON_RESPONSE = {"type": "json_object"}
+
+# Threads blocking on completions for the synchronous entry point; the async
+# functions use the client's acreate and hold no thread while waiting
+_llm_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_THREADS", "32")), thread_name_prefix="llm")
+
+def get_chat_completion():
+    """Return the ChatCompletion class for the configured backend"""
+    if LLM_BACKEND == "fake":
+        import fake_llm
+        return fake_llm.ChatCompletion
+    return openai.ChatCompletion
+
+# The worked examples below are written against the sample schema (schema.sql), so they are only
+# included when the prompt describes those tables; they would teach the model tables that don't exist otherwise
+SAMPLE_TABLES = {"Customer", "Order", "Product"}
+
+def _describes_sample_schema(tables):
+    return SAMPLE_TABLES <= {table.name for table in tables}
+
+async def prompt_tables_async(user_query):
+    """relevant_tables for the question, looked up on the SQLite executor: checking the schema
+    version is a query, and the event loop must not wait on the database"""
+    return await run_db(schema_catalog.relevant_tables, user_query)
 
+def build_understanding_prompt(user_query, tables=None):
+    """Prompt asking the model to explain what the question is asking for"""
+    tables = schema_catalog.relevant_tables(user_query) if tables is None else tables
+    example = """
 Example:
 Query: "Show me all purchases by John Doe in March 2024"
 Understanding: "You're looking for all purchases made by the customer 'John Doe' during March 2024. This will find orders with the specified customer name and filter by the order_date field for March 2024."
+""" if _describes_sample_schema(tables) else ""
+    return f"""
+Database Schema (with all column names):
+{schema_catalog.describe_schema(tables)}
 
+For the following natural language query, explain in a short 2-3 sentence summary what the query is asking for.
+This explanation will be shown to the user to verify their query was understood correctly.
+Be clear about what tables and fields are involved and any filters or aggregations.
+{example}
 Query: "{user_query}"
 """
-    understanding_response = openai.ChatCompletion.create(
-        model="gpt-4.1",
-        messages=[{"role": "user", "content": understanding_prompt}]
-    )
-    
-    understanding = understanding_response.choices[0].message.content.strip()
-    
-    # Now get the SQL query
-    sql_prompt = f"""
+
+def build_sql_prompt(user_query, tables=None):
+    """Prompt asking the model for a single SQLite query"""
+    tables = schema_catalog.relevant_tables(user_query) if tables is None else tables
+    return f"""
 Database Schema (with all column names):
-Customer (customer_id INTEGER, name TEXT, email TEXT)
-Product (product_id INTEGER, name TEXT, category TEXT, price REAL)
-"Order" (order_id INTEGER, customer_id INTEGER, product_id INTEGER, order_date DATE, quantity INTEGER, total_amount REAL)
+{schema_catalog.describe_schema(tables)}
 
 This is a SQLite database. Convert this natural language query into a valid SQLite SQL query.
 Return ONLY the SQL query without any explanation or markdown formatting.
+{sql_guidelines(tables)}
+Query: "{user_query}"
+"""
 
-Important SQLite syntax notes:
-1. "Order" is a reserved keyword in SQL and must ALWAYS be enclosed in double quotes like "Order" when used as a table name.
-2. Here are the correct column names for each table:
-   - Customer: customer_id, name, email
-   - Product: product_id, name, category, price
-   - "Order": order_id, customer_id, product_id, order_date, quantity, total_amount
-3. When joining tables, use table aliases and specify the join conditions clearly.
-4. Example: Customer AS C JOIN "Order" AS O ON C.customer_id = O.customer_id JOIN Product AS P ON O.product_id = P.product_id
-5. Use double quotes for table/column identifiers and single quotes for string literals.
-6. SQLite date format should be 'YYYY-MM-DD' format like '2024-03-15'.
-
+def sql_guidelines(tables):
+    """Syntax notes and example queries shared by the SQL and combined prompts"""
+    quoted = ", ".join(table.quoted_name for table in tables if table.quoted_name != table.name) or "none in this schema"
+    notes = [
+        f"Table names that are reserved keywords in SQL ({quoted}) must ALWAYS be enclosed in double quotes when used as a table name.",
+        f"Here are the correct column names for each table:\n{schema_catalog.describe_columns(tables)}",
+        "When joining tables, use table aliases and specify the join conditions clearly.",
+    ]
+    join = schema_catalog.join_example(tables)
+    if join:
+        notes.append(f"Example: {join}")
+    notes += [
+        "Use double quotes for table/column identifiers and single quotes for string literals.",
+        "SQLite date format should be 'YYYY-MM-DD' format like '2024-03-15'.",
+    ]
+    guidelines = "\nImportant SQLite syntax notes:\n" + "\n".join(f"{i}. {note}" for i, note in enumerate(notes, 1)) + "\n"
+    if _describes_sample_schema(tables):
+        guidelines += """
 Example correct queries:
-- SELECT O.order_id, C.name AS customer_name, P.name AS product_name, O.order_date, O.quantity, O.total_amount 
-  FROM "Order" AS O 
-  JOIN Customer AS C ON O.customer_id = C.customer_id 
-  JOIN Product AS P ON O.product_id = P.product_id 
+- SELECT O.order_id, C.name AS customer_name, P.name AS product_name, O.order_date, O.quantity, O.total_amount
+  FROM "Order" AS O
+  JOIN Customer AS C ON O.customer_id = C.customer_id
+  JOIN Product AS P ON O.product_id = P.product_id
   WHERE C.name = 'John Doe';
 
-- SELECT C.name, SUM(O.total_amount) AS total_spent 
-  FROM Customer AS C 
-  JOIN "Order" AS O ON C.customer_id = O.customer_id 
-  GROUP BY C.name 
-  ORDER BY total_spent DESC 
+- SELECT C.name, SUM(O.total_amount) AS total_spent
+  FROM Customer AS C
+  JOIN "Order" AS O ON C.customer_id = O.customer_id
+  GROUP BY C.name
+  ORDER BY total_spent DESC
   LIMIT 3;
+"""
+    return guidelines
 
+def build_combined_prompt(user_query, tables=None):
+    """Prompt asking for the understanding and the SQL in one JSON reply"""
+    tables = schema_catalog.relevant_tables(user_query) if tables is None else tables
+    example = """Example:
+Query: "Show me all purchases by John Doe in March 2024"
+{"understanding": "You're looking for all purchases made by the customer 'John Doe' during March 2024. This will find orders with the specified customer name and filter by the order_date field for March 2024.", "sql": "SELECT O.order_id, P.name AS product_name, O.order_date, O.quantity, O.total_amount FROM \\"Order\\" AS O JOIN Customer AS C ON O.customer_id = C.customer_id JOIN Product AS P ON O.product_id = P.product_id WHERE C.name = 'John Doe' AND O.order_date BETWEEN '2024-03-01' AND '2024-03-31';"}
+""" if _describes_sample_schema(tables) else ""
+    return f"""
+Database Schema (with all column names):
+{schema_catalog.describe_schema(tables)}
+
+This is a SQLite database. For the following natural language query:
+1. Explain in a short 2-3 sentence summary what the query is asking for. This explanation will be shown
+   to the user to verify their query was understood correctly. Be clear about what tables and fields are
+   involved and any filters or aggregations.
+2. Convert it into a single valid SQLite SQL query.
+
+Respond with ONLY a JSON object of this form, without markdown formatting:
+{{"understanding": "<the explanation>", "sql": "<the SQL query>"}}
+{sql_guidelines(tables)}
+{example}
 Query: "{user_query}"
 """
-    sql_response = openai.ChatCompletion.create(
-        model="gpt-4.1",
-        messages=[{"role": "user", "content": sql_prompt}]
+
+def complete(prompt, **kwargs):
+    """Send a single-message prompt to the model and return the reply text"""
+    response = get_chat_completion().create(
+        model=MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        **kwargs
+    )
+    record_tokens(response)
+    return response.choices[0].message.content.strip()
+
+def traced_complete(stage, prompt, **kwargs):
+    """complete() recorded as a span of the current trace"""
+    with span(stage):
+        return complete(prompt, **kwargs)
+
+async def complete_async(prompt, **kwargs):
+    """complete() on the client's async API"""
+    response = await get_chat_completion().acreate(
+        model=MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        **kwargs
     )
-    
-    # Extract the response
-    sql_with_possible_extra = sql_response.choices[0].message.content.strip()
-    
+    record_tokens(response)
+    return response.choices[0].message.content.strip()
+
+async def traced_complete_async(stage, prompt, **kwargs):
+    """complete_async() recorded as a span of the current trace"""
+    with span(stage):
+        return await complete_async(prompt, **kwargs)
+
+def extract_sql(sql_with_possible_extra):
+    """Pull the SQL statement out of a model reply"""
     # Try to extract just the SQL code
     # Look for SQL between triple backticks
     sql_match = re.search(r"```sql\s*(.*?)\s*```", sql_with_possible_extra, re.DOTALL)
     if sql_match:
-        sql = sql_match.group(1).strip()
-    else:
-        # If no backticks with sql, try just backticks
-        sql_match = re.search(r"```\s*(.*?)\s*```", sql_with_possible_extra, re.DOTALL)
-        if sql_match:
-            sql = sql_match.group(1).strip()
-        else:
-            # Otherwise use the whole response
-            sql = sql_with_possible_extra
-    
+        return sql_match.group(1).strip()
+    # If no backticks with sql, try just backticks
+    sql_match = re.search(r"```\s*(.*?)\s*```", sql_with_possible_extra, re.DOTALL)
+    if sql_match:
+        return sql_match.group(1).strip()
+    # Otherwise use the whole response
+    return sql_with_possible_extra
+
+def parse_combined_reply(reply):
+    """Return {"understanding", "sql"} from a combined-mode reply; raises ValueError if there isn't one"""
+    decoder = json.JSONDecoder()
+    # The first JSON object with a "sql" string wins, wherever it is (fences, leading prose, trailing notes)
+    start = reply.find("{")
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(reply, start)
+        except json.JSONDecodeError:
+            value = None
+        if isinstance(value, dict) and isinstance(value.get("sql"), str) and value["sql"].strip():
+            understanding = value.get("understanding")
+            return {
+                "understanding": understanding.strip() if isinstance(understanding, str) else "",
+                "sql": extract_sql(value["sql"].strip())
+            }
+        start = reply.find("{", start + 1)
+    raise ValueError("No JSON object with a sql field in the reply")
+
+def _combined_result(reply):
+    with span("sql_extract"):
+        result = parse_combined_reply(reply)
+    result["llm_mode"] = "single"
+    return result
+
+def _resolve_mode(mode):
+    mode = mode or LLM_MODE
+    if mode not in LLM_MODES:
+        raise ValueError(f"llm_mode must be one of {', '.join(LLM_MODES)}, got {mode!r}")
+    return mode
+
+def nl_to_sql_with_understanding(user_query, mode=None):
+    """Convert natural language to SQL with understanding explanation"""
+    mode = _resolve_mode(mode)
+    if mode == "single":
+        reply = traced_complete("llm_combined", build_combined_prompt(user_query), response_format=JSON_RESPONSE)
+        try:
+            return _combined_result(reply)
+        except ValueError as e:
+            print(f"[WARN] Combined reply could not be parsed, falling back to two calls: {e}")
+    # The two prompts are independent, so the understanding call runs on a
+    # worker thread while this thread waits on the SQL call
+    understanding_future = _llm_executor.submit(
+        contextvars.copy_context().run, traced_complete, "llm_understanding", build_understanding_prompt(user_query)
+    )
+    sql_with_possible_extra = traced_complete("llm_sql", build_sql_prompt(user_query))
+    with span("sql_extract"):
+        sql = extract_sql(sql_with_possible_extra)
+
+    return {
+        "understanding": understanding_future.result(),
+        "sql": sql,
+        "llm_mode": "two_call" if mode == "two_call" else "single_fallback"
+    }
+
+async def nl_to_sql_with_understanding_async(user_query, mode=None):
+    """Async variant of nl_to_sql_with_understanding that awaits both completions concurrently"""
+    mode = _resolve_mode(mode)
+    tables = await prompt_tables_async(user_query)
+    if mode == "single":
+        reply = await traced_complete_async("llm_combined", build_combined_prompt(user_query, tables),
+                                            response_format=JSON_RESPONSE)
+        try:
+            return _combined_result(reply)
+        except ValueError as e:
+            print(f"[WARN] Combined reply could not be parsed, falling back to two calls: {e}")
+    understanding, sql_with_possible_extra = await asyncio.gather(
+        traced_complete_async("llm_understanding", build_understanding_prompt(user_query, tables)),
+        traced_complete_async("llm_sql", build_sql_prompt(user_query, tables)),
+    )
+    with span("sql_extract"):
+        sql = extract_sql(sql_with_possible_extra)
+
     return {
         "understanding": understanding,
-        "sql": sql
+        "sql": sql,
+        "llm_mode": "two_call" if mode == "two_call" else "single_fallback"
     }
 
+async def generate_sql_async(user_query, tables=None):
+    """Just the SQL half of nl_to_sql_with_understanding_async"""
+    if tables is None:
+        tables = await prompt_tables_async(user_query)
+    sql_with_possible_extra = await traced_complete_async("llm_sql", build_sql_prompt(user_query, tables))
+    with span("sql_extract"):
+        return extract_sql(sql_with_possible_extra)
+
+async def stream_understanding(user_query, tables=None):
+    """Yield the understanding text as the model produces it"""
+    if tables is None:
+        tables = await prompt_tables_async(user_query)
+    with span("llm_understanding"):
+        response = await get_chat_completion().acreate(
+            model=MODEL,
+            messages=[{"role": "user", "content": build_understanding_prompt(user_query, tables)}],
+            stream=True
+        )
+        async for chunk in response:
+            record_tokens(chunk)
+            if not chunk.choices:
+                continue
+            content = getattr(chunk.choices[0].delta, "content", None)
+            if content:
+                yield content
+
 def nl_to_sql(user_query):
     """Legacy function for backward compatibility"""
     result = nl_to_sql_with_understanding(user_query)
@@ -0,0 +1,99 @@
+"""Background refresh of pinned reports.
+
+A daemon thread wakes up every PIN_SCHEDULER_TICK seconds, finds the pins whose
+refresh interval has elapsed and runs their stored SQL on a small worker pool,
+materializing each result into PinResults. The pool size (PIN_REFRESH_WORKERS)
+bounds how many pin queries can run at once so a long pin list can't crowd out
+interactive queries.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from db import execute_sql
+from pinning import get_pin, get_pins, get_due_pin_ids, save_pin_result
+
+PIN_SCHEDULER_ENABLED = os.getenv("PIN_SCHEDULER_ENABLED", "1") == "1"
+PIN_REFRESH_INTERVAL = int(os.getenv("PIN_REFRESH_INTERVAL", "3600"))
+PIN_SCHEDULER_TICK = float(os.getenv("PIN_SCHEDULER_TICK", "30"))
+PIN_REFRESH_WORKERS = int(os.getenv("PIN_REFRESH_WORKERS", "2"))
+
+class PinScheduler:
+    def __init__(self, tick=PIN_SCHEDULER_TICK, workers=PIN_REFRESH_WORKERS,
+                 default_interval=PIN_REFRESH_INTERVAL):
+        self.tick = tick
+        self.default_interval = default_interval
+        self.workers = workers
+        # Created on first use, and again after stop(), since a shut down executor takes no more work
+        self.executor = None
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="pin-scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.tick)
+            self.thread = None
+        with self.lock:
+            executor, self.executor = self.executor, None
+            # Cancelled refreshes never run their finally, so forget them here
+            self.in_flight.clear()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.submit(get_due_pin_ids(self.default_interval))
+            except Exception as e:
+                print(f"[WARN] Pin scheduler tick failed: {e}")
+            self.stop_event.wait(self.tick)
+
+    def submit(self, pin_ids):
+        """Queue pins for refresh, skipping any that are already running; returns how many were queued"""
+        queued = 0
+        for pin_id in pin_ids:
+            with self.lock:
+                if pin_id in self.in_flight:
+                    continue
+                self.in_flight.add(pin_id)
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pin-refresh")
+                executor = self.executor
+            executor.submit(self._refresh, pin_id)
+            queued += 1
+        return queued
+
+    def refresh_all(self):
+        return self.submit([pin[0] for pin in get_pins()])
+
+    def _refresh(self, pin_id):
+        try:
+            refresh_pin(pin_id)
+        except Exception as e:
+            print(f"[WARN] Refreshing pin {pin_id} failed: {e}")
+        finally:
+            with self.lock:
+                self.in_flight.discard(pin_id)
+
+def refresh_pin(pin_id):
+    """Run a pin's stored SQL now and materialize the result; returns it, or None if the pin is gone"""
+    pin = get_pin(pin_id)
+    if pin is None:
+        return None
+    # Columnar results carry their column types, so the app doesn't have to guess them
+    result = execute_sql(pin[2], "columnar")
+    save_pin_result(pin_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), result)
+    return result
+
+scheduler = PinScheduler()
@@ -1,99 +1,333 @@
-import sqlite3
 import json
+import sqlite3
+from connection_pool import get_app_pool
+from snapshots import encode_snapshot, decode_snapshot
+
+HISTORY_FTS_ENABLED = True
 
 def setup_pinning():
-    conn = sqlite3.connect("genai.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS PinnedReports (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_query TEXT,
-        sql_query TEXT,
-        chart_type TEXT DEFAULT 'table'
-    )
-    """)
+    with get_app_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS PinnedReports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_query TEXT,
+            sql_query TEXT,
+            chart_type TEXT DEFAULT 'table'
+        )
+        """)
+    
+        # Per-pin refresh interval in seconds (NULL means the scheduler default)
+        cursor.execute("PRAGMA table_info(PinnedReports)")
+        if "refresh_interval" not in [col[1] for col in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE PinnedReports ADD COLUMN refresh_interval INTEGER")
     
-    # Create a table for query history
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS QueryHistory (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT,
-        user_query TEXT,
-        sql_query TEXT,
-        understanding TEXT,
-        data TEXT
-    )
-    """)
+        # Latest materialized result of each pinned report
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS PinResults (
+            pin_id INTEGER PRIMARY KEY,
+            refreshed_at TEXT,
+            row_count INTEGER,
+            result TEXT
+        )
+        """)
     
-    conn.commit()
-    conn.close()
+        # Create a table for query history
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS QueryHistory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            user_query TEXT,
+            sql_query TEXT,
+            understanding TEXT,
+            data TEXT
+        )
+        """)
+    
+        # Per-stage timings, token and row counts of the request (JSON, see tracing.py)
+        cursor.execute("PRAGMA table_info(QueryHistory)")
+        if "timings" not in [col[1] for col in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE QueryHistory ADD COLUMN timings TEXT")
+    
+        # Rows rolled out of QueryHistory by the retention job (see history_retention.py)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS QueryHistoryArchive (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT,
+            user_query TEXT,
+            sql_query TEXT,
+            understanding TEXT,
+            data TEXT,
+            timings TEXT
+        )
+        """)
+    
+        conn.commit()
+    setup_history_search()
+
+def setup_history_search():
+    """Full-text index over the question, SQL and understanding of each history entry, kept in sync by triggers"""
+    global HISTORY_FTS_ENABLED
+    with get_app_pool().connection() as conn:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'QueryHistoryFTS'"
+        ).fetchone()
+        if exists:
+            return
+        try:
+            conn.execute("""
+            CREATE VIRTUAL TABLE QueryHistoryFTS USING fts5(
+                user_query, sql_query, understanding,
+                content='QueryHistory', content_rowid='id'
+            )
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"[WARN] FTS5 unavailable, history search falls back to LIKE: {e}")
+            HISTORY_FTS_ENABLED = False
+            return
+        conn.executescript("""
+        CREATE TRIGGER IF NOT EXISTS QueryHistory_fts_insert AFTER INSERT ON QueryHistory BEGIN
+            INSERT INTO QueryHistoryFTS (rowid, user_query, sql_query, understanding)
+            VALUES (new.id, new.user_query, new.sql_query, new.understanding);
+        END;
+        CREATE TRIGGER IF NOT EXISTS QueryHistory_fts_delete AFTER DELETE ON QueryHistory BEGIN
+            INSERT INTO QueryHistoryFTS (QueryHistoryFTS, rowid, user_query, sql_query, understanding)
+            VALUES ('delete', old.id, old.user_query, old.sql_query, old.understanding);
+        END;
+        CREATE TRIGGER IF NOT EXISTS QueryHistory_fts_update AFTER UPDATE ON QueryHistory BEGIN
+            INSERT INTO QueryHistoryFTS (QueryHistoryFTS, rowid, user_query, sql_query, understanding)
+            VALUES ('delete', old.id, old.user_query, old.sql_query, old.understanding);
+            INSERT INTO QueryHistoryFTS (rowid, user_query, sql_query, understanding)
+            VALUES (new.id, new.user_query, new.sql_query, new.understanding);
+        END;
+        """)
+        # Index the entries saved before the index existed
+        conn.execute("INSERT INTO QueryHistoryFTS (QueryHistoryFTS) VALUES ('rebuild')")
+        conn.commit()
 
-def save_pin(user_query, sql_query, chart_type="table"):
-    conn = sqlite3.connect("genai.db")
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO PinnedReports (user_query, sql_query, chart_type) VALUES (?, ?, ?)",
-                   (user_query, sql_query, chart_type))
-    conn.commit()
-    conn.close()
+def save_pin(user_query, sql_query, chart_type="table", refresh_interval=None):
+    with get_app_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO PinnedReports (user_query, sql_query, chart_type, refresh_interval) VALUES (?, ?, ?, ?)",
+                       (user_query, sql_query, chart_type, refresh_interval))
+        pin_id = cursor.lastrowid
+        conn.commit()
+    return pin_id
 
 def get_pins():
-    conn = sqlite3.connect("genai.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, user_query, sql_query, chart_type FROM PinnedReports")
-    return cursor.fetchall()
+    with get_app_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, user_query, sql_query, chart_type FROM PinnedReports")
+        pins = cursor.fetchall()
+    return pins
+
+def get_pin(pin_id):
+    """Get a single pinned report, or None if it doesn't exist"""
+    with get_app_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, user_query, sql_query, chart_type FROM PinnedReports WHERE id = ?",
+                       (pin_id,))
+        pin = cursor.fetchone()
+    return pin
+
+def get_pins_with_results():
+    """Get all pinned reports together with their latest materialized result"""
+    with get_app_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+        SELECT p.id, p.user_query, p.sql_query, p.chart_type, p.refresh_interval,
+               r.refreshed_at, r.row_count, r.result
+        FROM PinnedReports p
+        LEFT JOIN PinResults r ON r.pin_id = p.id
+        ORDER BY p.id
+        """)
+        pins = cursor.fetchall()
+    
+    return [
+        {
+            "id": item[0],
+            "user_query": item[1],
+            "sql_query": item[2],
+            "chart_type": item[3],
+            "refresh_interval": item[4],
+            "refreshed_at": item[5],
+            "row_count": item[6],
+            "result": json.loads(item[7]) if item[7] else None
+        }
+        for item in pins
+    ]
+
+def get_due_pin_ids(default_interval):
+    """Ids of pins never refreshed or whose refresh interval has elapsed"""
+    with get_app_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+        SELECT p.id
+        FROM PinnedReports p
+        LEFT JOIN PinResults r ON r.pin_id = p.id
+        WHERE r.refreshed_at IS NULL
+           OR (julianday('now', 'localtime') - julianday(r.refreshed_at)) * 86400
+              >= COALESCE(p.refresh_interval, ?)
+        """, (default_interval,))
+        pin_ids = [row[0] for row in cursor.fetchall()]
+    return pin_ids
 
-def update_pin(pin_id, chart_type=None):
+def save_pin_result(pin_id, refreshed_at, result):
+    """Store the latest result of a pinned report, replacing the previous one"""
+    with get_app_pool().connection() as conn:
+        cursor = conn.cursor()
+        if "data" in result:
+            row_count = len(result["data"][0]) if result["data"] else 0
+        else:
+            row_count = len(result.get("rows", []))
+        cursor.execute("""
+        INSERT OR REPLACE INTO PinResults (pin_id, refreshed_at, row_count, result)
+        VALUES (?, ?, ?, ?)
+        """, (pin_id, refreshed_at, row_count, json.dumps(result)))
+        conn.commit()
+    return True
+
+def update_pin(pin_id, chart_type=None, refresh_interval=None):
     """Update a pinned report's settings"""
-    conn = sqlite3.connect("genai.db")
-    cursor = conn.cursor()
-    if chart_type:
-        cursor.execute("UPDATE PinnedReports SET chart_type = ? WHERE id = ?", 
-                      (chart_type, pin_id))
-    conn.commit()
-    conn.close()
+    with get_app_pool().connection() as conn:
+        cursor = conn.cursor()
+        if chart_type:
+            cursor.execute("UPDATE PinnedReports SET chart_type = ? WHERE id = ?", 
+                          (chart_type, pin_id))
+        if refresh_interval:
+            cursor.execute("UPDATE PinnedReports SET refresh_interval = ? WHERE id = ?",
+                          (refresh_interval, pin_id))
+        conn.commit()
     return True
 
-def save_query_history(timestamp, user_query, sql_query, understanding, data=None):
+def save_query_history(timestamp, user_query, sql_query, understanding, data=None, timings=None):
     """Save a query to history"""
-    conn = sqlite3.connect("genai.db")
-    cursor = conn.cursor()
-    
-    # Convert data to JSON if provided
-    data_json = json.dumps(data) if data else None
-    
-    cursor.execute("""
-    INSERT INTO QueryHistory (timestamp, user_query, sql_query, understanding, data) 
-    VALUES (?, ?, ?, ?, ?)
-    """, (timestamp, user_query, sql_query, understanding, data_json))
-    
-    conn.commit()
-    conn.close()
+    return save_query_history_batch([(timestamp, user_query, sql_query, understanding, data, timings)])
+
+def save_query_history_batch(entries):
+    """Save (timestamp, user_query, sql_query, understanding, data, timings) tuples in one transaction"""
+    # Store each result as a compressed snapshot (None when it is over the size cap)
+    rows = [
+        (timestamp, user_query, sql_query, understanding,
+         encode_snapshot(data) if data else None, json.dumps(timings) if timings else None)
+        for timestamp, user_query, sql_query, understanding, data, timings in entries
+    ]
+    with get_app_pool().connection() as conn:
+        conn.executemany("""
+        INSERT INTO QueryHistory (timestamp, user_query, sql_query, understanding, data, timings) 
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
     return True
 
-def get_query_history(limit=50):
-    """Get recent query history"""
-    conn = sqlite3.connect("genai.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-    SELECT id, timestamp, user_query, sql_query, understanding 
-    FROM QueryHistory 
-    ORDER BY id DESC 
-    LIMIT ?
-    """, (limit,))
-    
-    history = cursor.fetchall()
-    conn.close()
-    
-    # Format the results as dictionaries
-    history_list = [
+HISTORY_COLUMNS = "h.id, h.timestamp, h.user_query, h.sql_query, h.understanding, h.timings, h.data IS NOT NULL"
+
+def _history_page(rows, limit):
+    """Format history rows; next_cursor continues after the last one when the page is full"""
+    items = [
         {
             "id": item[0],
             "timestamp": item[1],
             "query": item[2],
             "sql": item[3],
-            "understanding": item[4]
+            "understanding": item[4],
+            "timings": json.loads(item[5]) if item[5] else None,
+            "has_snapshot": bool(item[6])
         }
-        for item in history
+        for item in rows
     ]
+    return {"items": items, "next_cursor": items[-1]["id"] if items and len(items) == limit else None}
+
+def get_query_history(limit=50, cursor=None):
+    """Get a page of query history, newest first; cursor is the next_cursor of the previous page"""
+    # Keyset pagination: seeking on the primary key costs the same on page 1 and page 10,000
+    with get_app_pool().connection() as conn:
+        rows = conn.execute(f"""
+        SELECT {HISTORY_COLUMNS}
+        FROM QueryHistory h
+        WHERE h.id < ?
+        ORDER BY h.id DESC
+        LIMIT ?
+        """, (cursor if cursor is not None else 2 ** 63 - 1, limit)).fetchall()
+    return _history_page(rows, limit)
+
+def _fts_query(text):
+    # Every word must match, the last one as a prefix so results follow the typing; quoting keeps
+    # FTS5 operators and punctuation in user input from being parsed as syntax
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if words:
+        words[-1] += "*"
+    return " ".join(words)
+
+def search_query_history(text, limit=50, cursor=None):
+    """Page of history entries whose question, SQL or understanding contain all the words in text"""
+    if not text.split():
+        return get_query_history(limit, cursor)
+    cursor = cursor if cursor is not None else 2 ** 63 - 1
+    with get_app_pool().connection() as conn:
+        if HISTORY_FTS_ENABLED:
+            rows = conn.execute(f"""
+            SELECT {HISTORY_COLUMNS}
+            FROM QueryHistoryFTS f
+            JOIN QueryHistory h ON h.id = f.rowid
+            WHERE QueryHistoryFTS MATCH ? AND f.rowid < ?
+            ORDER BY f.rowid DESC
+            LIMIT ?
+            """, (_fts_query(text), cursor, limit)).fetchall()
+        else:
+            conditions = " AND ".join(["(h.user_query || ' ' || h.sql_query || ' ' || COALESCE(h.understanding, '')) LIKE ?"]
+                                      * len(text.split()))
+            rows = conn.execute(f"""
+            SELECT {HISTORY_COLUMNS}
+            FROM QueryHistory h
+            WHERE {conditions} AND h.id < ?
+            ORDER BY h.id DESC
+            LIMIT ?
+            """, [f"%{word}%" for word in text.split()] + [cursor, limit]).fetchall()
+    return _history_page(rows, limit)
+
+def archive_query_history(before_timestamp, chunk_size=5000):
+    """Move the oldest entries saved before before_timestamp to QueryHistoryArchive, at most
+    chunk_size at a time; returns how many were moved"""
+    with get_app_pool().connection() as conn:
+        # ids grow with time, so the expired entries are a prefix of the table in id order and
+        # finding them reads at most chunk_size rows, however large the table is
+        last_id = None
+        for history_id, timestamp in conn.execute(
+            "SELECT id, timestamp FROM QueryHistory ORDER BY id LIMIT ?", (chunk_size,)
+        ):
+            if timestamp >= before_timestamp:
+                break
+            last_id = history_id
+        if last_id is None:
+            return 0
+        conn.execute("""
+        INSERT OR REPLACE INTO QueryHistoryArchive (id, timestamp, user_query, sql_query, understanding, data, timings)
+        SELECT id, timestamp, user_query, sql_query, understanding, data, timings
+        FROM QueryHistory WHERE id <= ?
+        """, (last_id,))
+        moved = conn.execute("DELETE FROM QueryHistory WHERE id <= ?", (last_id,)).rowcount
+        conn.commit()
+    return moved
+
+def get_query_history_entry(history_id):
+    """One history entry with its stored result snapshot (None if there is none)"""
+    with get_app_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+        SELECT id, timestamp, user_query, sql_query, understanding, data 
+        FROM QueryHistory 
+        WHERE id = ?
+        """, (history_id,))
+        item = cursor.fetchone()
     
-    return history_list
+    if item is None:
+        return None
+    return {
+        "id": item[0],
+        "timestamp": item[1],
+        "query": item[2],
+        "sql": item[3],
+        "understanding": item[4],
+        "snapshot": decode_snapshot(item[5]) if item[5] else None
+    }
@@ -0,0 +1,214 @@
+"""Cache of executed SQL results.
+
+Results of db.execute_sql are kept in an in-memory LRU keyed on the SQL text
+(surrounding whitespace, trailing semicolons and runs of whitespace outside
+literals don't matter) and bounded by the estimated size of the cached rows,
+RESULT_CACHE_MAX_BYTES.
+
+Staleness is ruled out with per-table change counters: triggers on every data
+table bump that table's row in TableVersions on insert, update and delete.
+Each entry remembers the versions of the tables it read (reported by the
+sandbox authorizer) as they were before the query ran, and is dropped on
+lookup if any of them has moved. Reading the counters is skipped while
+PRAGMA data_version on a dedicated connection is unchanged, i.e. while no
+other connection has committed anything. Dropping a table drops its triggers
+but not its counter, so a counter only counts while all three triggers exist,
+and entries also remember PRAGMA schema_version: a table dropped and created
+again invalidates everything cached before, and stays unversioned afterwards
+until setup_result_cache reinstalls its triggers. Results that read an
+unversioned table, or depend on the clock or random(), are never cached.
+"""
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from connection_pool import get_pool
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Larger results would push most of the cache out for a single entry
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(RESULT_CACHE_MAX_BYTES // 8)))
+
+TRIGGER_PREFIX = "result_cache_"
+TRIGGER_EVENTS = ("insert", "update", "delete")
+# Key of the schema version among the table versions; not a valid table name
+SCHEMA_KEY = "\0schema"
+# Tables the app itself writes on every request; caching results over them isn't worth the invalidations
+APP_TABLES = {"PinnedReports", "PinResults", "QueryHistory", "QueryHistoryArchive", "TranslationCache",
+              "IndexAdvisorStats", "TableVersions"}
+# QueryHistory's full-text index and its FTS5 shadow tables
+APP_TABLES |= {"QueryHistoryFTS"} | {f"QueryHistoryFTS_{suffix}" for suffix in ("data", "idx", "docsize", "config")}
+
+QUOTED_PATTERN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+VOLATILE_PATTERN = re.compile(
+    r"'now'|\brandom(?:blob)?\s*\(|\bcurrent_(?:date|time|timestamp)\b"
+    r"|\b(?:date|time|datetime|julianday|unixepoch)\s*\(\s*\)",
+    re.IGNORECASE,
+)
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_bytes = 0
+_watcher = None
+_data_version = None
+_schema_version = None
+_triggered = set()
+_versions = {}
+_stats = {"hits": 0, "misses": 0, "invalidated": 0, "evictions": 0, "stores": 0, "uncacheable": 0}
+
+def normalize_sql(sql):
+    """Whitespace-insensitive form of a statement, leaving string literals and quoted names alone"""
+    parts = QUOTED_PATTERN.split(sql.strip().rstrip(";").strip())
+    return "".join(part if i % 2 else " ".join(part.split()) for i, part in enumerate(parts))
+
+def is_cacheable(sql):
+    return RESULT_CACHE_ENABLED and not VOLATILE_PATTERN.search(sql)
+
+def install_triggers(conn, table):
+    """Keep table's change counter in TableVersions up to date"""
+    conn.execute("INSERT OR IGNORE INTO TableVersions (table_name, version) VALUES (?, 0)", (table,))
+    quoted = table.replace("'", "''")
+    for event in TRIGGER_EVENTS:
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS "{TRIGGER_PREFIX}{table}_{event}" AFTER {event.upper()} ON "{table}"
+        BEGIN
+            UPDATE TableVersions SET version = version + 1 WHERE table_name = '{quoted}';
+        END
+        """)
+
+def drop_triggers(conn, table):
+    """Drop table's counter triggers (for bulk loads); returns whether there were any"""
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? AND name LIKE ?",
+        (table, TRIGGER_PREFIX + "%"),
+    )]
+    for name in names:
+        conn.execute(f'DROP TRIGGER "{name}"')
+    return bool(names)
+
+def bump_version(conn, table):
+    conn.execute("UPDATE TableVersions SET version = version + 1 WHERE table_name = ?", (table,))
+
+def setup_result_cache():
+    with get_pool().connection() as conn:
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS TableVersions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        """)
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        for table in tables:
+            if table not in APP_TABLES:
+                install_triggers(conn, table)
+        conn.commit()
+
+def _triggered_tables(conn):
+    """Tables that still have all of their counter triggers"""
+    names = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?", (TRIGGER_PREFIX + "%",)
+    )}
+    tables = {name[len(TRIGGER_PREFIX):].rsplit("_", 1)[0] for name in names}
+    return {table for table in tables
+            if all(f"{TRIGGER_PREFIX}{table}_{event}" in names for event in TRIGGER_EVENTS)}
+
+def _current_versions():
+    """Change counter of every versioned table, plus the schema version; call with _lock held"""
+    global _watcher, _data_version, _schema_version, _triggered, _versions
+    try:
+        if _watcher is None:
+            _watcher = sqlite3.connect(f"file:{get_pool().path}?mode=ro", uri=True, check_same_thread=False)
+        data_version = _watcher.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != _data_version:
+            with _watcher:
+                # One read transaction, so the triggers and counters are from the same schema
+                _watcher.execute("BEGIN")
+                schema_version = _watcher.execute("PRAGMA schema_version").fetchone()[0]
+                if schema_version != _schema_version:
+                    _triggered = _triggered_tables(_watcher)
+                versions = _watcher.execute("SELECT table_name, version FROM TableVersions").fetchall()
+            _versions = {table: version for table, version in versions if table in _triggered}
+            _versions[SCHEMA_KEY] = schema_version
+            _data_version, _schema_version = data_version, schema_version
+    except sqlite3.Error:
+        # No TableVersions yet (setup_result_cache hasn't run), so nothing is cacheable
+        _versions, _data_version, _schema_version = {}, None, None
+    return _versions
+
+def current_versions():
+    with _lock:
+        return dict(_current_versions())
+
+def _estimate_bytes(cols, rows):
+    size = sum(len(col) for col in cols) + 64
+    for row in rows:
+        size += 56 + 8 * len(row)
+        for value in row:
+            size += len(value) if isinstance(value, (str, bytes)) else 16
+    return size
+
+def lookup(key):
+    """Return the cached (columns, rows, truncated) for key, or None"""
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        versions = _current_versions()
+        if any(versions.get(table) != version for table, version in entry["versions"].items()):
+            _drop(key)
+            _stats["invalidated"] += 1
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return entry["cols"], entry["rows"], entry["truncated"]
+
+def store(key, tables, versions, cols, rows, truncated):
+    """Cache a result; versions must have been read before the query ran"""
+    global _bytes
+    if SCHEMA_KEY not in versions or not all(table in versions for table in tables):
+        with _lock:
+            _stats["uncacheable"] += 1
+        return
+    size = _estimate_bytes(cols, rows)
+    if size > RESULT_CACHE_MAX_ENTRY_BYTES:
+        with _lock:
+            _stats["uncacheable"] += 1
+        return
+    entry = {"cols": cols, "rows": rows, "truncated": truncated, "bytes": size,
+             "versions": {table: versions[table] for table in (*tables, SCHEMA_KEY)}}
+    with _lock:
+        if key in _entries:
+            _drop(key)
+        _entries[key] = entry
+        _bytes += size
+        _stats["stores"] += 1
+        while _bytes > RESULT_CACHE_MAX_BYTES:
+            _drop(next(iter(_entries)))
+            _stats["evictions"] += 1
+
+def _drop(key):
+    global _bytes
+    _bytes -= _entries.pop(key)["bytes"]
+
+def clear():
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _bytes = 0
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_entries)
+        stats["bytes"] = _bytes
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["max_bytes"] = RESULT_CACHE_MAX_BYTES
+    stats["enabled"] = RESULT_CACHE_ENABLED
+    return stats
@@ -0,0 +1,85 @@
+"""Payload formats for query results.
+
+- "rows": {"columns": [...], "rows": [{col: val, ...}, ...]} (the default)
+- "columnar": {"columns": [...], "types": [...], "data": [[col0 values], [col1 values], ...]}
+- "arrow": Arrow IPC stream bytes, built from the columnar form (needs pyarrow)
+
+Column types are SQLite storage classes ("integer", "real", "text", "blob" or
+"null" when a column has no values), taken from the values SQLite returned.
+An Arrow stream has no room for the paging fields, so they go into its schema
+metadata, where values other than strings are JSON-encoded.
+"""
+import json
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+FORMATS = ("rows", "columnar", "arrow")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+_STORAGE_CLASSES = {int: "integer", float: "real", str: "text", bytes: "blob"}
+
+def column_type(values):
+    """Storage class of a column; integers mixed with reals count as real, anything else mixed as text"""
+    seen = {type(value) for value in values if value is not None}
+    if not seen:
+        return "null"
+    if len(seen) == 1:
+        return _STORAGE_CLASSES.get(seen.pop(), "text")
+    if seen <= {int, float}:
+        return "real"
+    return "text"
+
+def shape_result(cols, rows, format="rows"):
+    """Build a result payload from column names and row tuples"""
+    if format == "rows":
+        return {"columns": cols, "rows": [dict(zip(cols, row)) for row in rows]}
+    data = [list(values) for values in zip(*rows)] if rows else [[] for _ in cols]
+    return {"columns": cols, "types": [column_type(values) for values in data], "data": data}
+
+def reshape_result(result, format="rows"):
+    """Convert a "rows" or "columnar" payload to the given format"""
+    if ("rows" in result) == (format == "rows"):
+        return result
+    cols = result["columns"]
+    if "rows" in result:
+        rows = [tuple(row.values()) for row in result["rows"]]
+    else:
+        rows = list(zip(*result["data"]))
+    reshaped = shape_result(cols, rows, format)
+    # Keep paging fields and the like
+    reshaped.update((key, value) for key, value in result.items() if key not in ("columns", "rows", "types", "data"))
+    return reshaped
+
+# Fields next to the rows that a client needs to page through or judge a result
+PAGING_FIELDS = ("offset", "has_more", "next_page_token", "truncated")
+
+def arrow_metadata(result, **fields):
+    """Schema metadata for an Arrow response: fields plus the result's paging fields"""
+    metadata = dict(fields)
+    metadata.update((key, result[key]) for key in PAGING_FIELDS if key in result)
+    return metadata
+
+_ARROW_TYPES = {"integer": "int64", "real": "float64", "text": "string", "blob": "binary", "null": "null"}
+
+def to_arrow_ipc(result, metadata=None):
+    """Serialize a columnar result to Arrow IPC stream bytes"""
+    if pa is None:
+        raise RuntimeError("Arrow format requires pyarrow (pip install pyarrow)")
+    arrays = []
+    for values, col_type in zip(result["data"], result["types"]):
+        if col_type == "text":
+            # Mixed columns are sent as text, like the columnar payload declares
+            values = [None if value is None else str(value) for value in values]
+        arrays.append(pa.array(values, type=getattr(pa, _ARROW_TYPES[col_type])()))
+    schema = pa.schema(
+        [pa.field(name, array.type) for name, array in zip(result["columns"], arrays)],
+        metadata={key: value if isinstance(value, str) else json.dumps(value)
+                  for key, value in (metadata or {}).items()},
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+    return sink.getvalue().to_pybytes()
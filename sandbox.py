@@ -0,0 +1,101 @@
+"""Guard rails for running SQL we didn't write.
+
+db.py executes LLM-generated (and pinned) SQL through sandboxed connections:
+- they come from a read-only pool, opened with a mode=ro URI;
+- an authorizer allows reading tables and calling functions and denies
+  everything else, so only SELECT statements (CTEs included) compile; the
+  app's own tables can't be read even when they share the data file;
+- a progress handler checks a wall-clock deadline every SQL_SANDBOX_STEPS
+  virtual machine instructions and aborts the statement once it has passed,
+  so a runaway join frees its worker within milliseconds of the timeout.
+db.py also stops fetching after SQL_MAX_ROWS rows and marks the result
+truncated. Set SQL_SANDBOX_ENABLED=0 to go back to the unrestricted pool.
+"""
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from connection_pool import get_pool
+from result_cache import APP_TABLES
+
+SQL_SANDBOX_ENABLED = os.getenv("SQL_SANDBOX_ENABLED", "1") == "1"
+SQL_TIMEOUT_SECONDS = float(os.getenv("SQL_TIMEOUT_SECONDS", "10"))
+# Exports stream large results to the client, so they get longer
+SQL_EXPORT_TIMEOUT_SECONDS = float(os.getenv("SQL_EXPORT_TIMEOUT_SECONDS", "300"))
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "10000"))
+# VM instructions between deadline checks; each check is one monotonic() call
+SQL_SANDBOX_STEPS = int(os.getenv("SQL_SANDBOX_STEPS", "10000"))
+
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+class QueryTimeout(Exception):
+    pass
+
+class QueryNotAllowed(Exception):
+    pass
+
+# How SQLite reports a statement the authorizer denied: "not authorized" for a denied action,
+# "access to T.c is prohibited" for a denied read
+_DENIED_MESSAGES = ("not authorized", "is prohibited")
+
+def authorize(action, arg1, arg2, db_name, trigger):
+    """sqlite3 authorizer that only lets read-only statements over the data tables compile"""
+    if action == sqlite3.SQLITE_READ and arg1 in APP_TABLES:
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+def _recording(authorizer, tables):
+    # Setting an authorizer expires cached statements, so it sees every table even on a warm connection
+    def record(action, arg1, arg2, db_name, trigger):
+        if action == sqlite3.SQLITE_READ:
+            tables.add(arg1)
+        return authorizer(action, arg1, arg2, db_name, trigger)
+    return record
+
+class _Deadline:
+    """Progress handler that aborts the running statement after timeout seconds"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.at = time.monotonic() + timeout
+        self.expired = False
+
+    def __call__(self):
+        if time.monotonic() > self.at:
+            self.expired = True
+            return 1
+        return 0
+
+@contextmanager
+def connection(timeout=SQL_TIMEOUT_SECONDS, tables=None):
+    """Check out a read-only connection that only runs SELECTs and gives up after timeout seconds
+
+    If tables is a set, the names of the tables the statement reads are added to it.
+    """
+    if not SQL_SANDBOX_ENABLED:
+        with get_pool().connection() as conn:
+            if tables is None:
+                yield conn
+                return
+            conn.set_authorizer(_recording(lambda *args: sqlite3.SQLITE_OK, tables))
+            try:
+                yield conn
+            finally:
+                conn.set_authorizer(None)
+        return
+    with get_pool(read_only=True).connection() as conn:
+        deadline = _Deadline(timeout)
+        conn.set_authorizer(authorize if tables is None else _recording(authorize, tables))
+        conn.set_progress_handler(deadline, SQL_SANDBOX_STEPS)
+        try:
+            yield conn
+        except sqlite3.DatabaseError as e:
+            # Denials surface as DatabaseError or, e.g. for load_extension(), OperationalError
+            if deadline.expired:
+                raise QueryTimeout(f"Query cancelled after exceeding the {timeout:g}s time limit") from e
+            if any(message in str(e) for message in _DENIED_MESSAGES):
+                raise QueryNotAllowed("Only read-only SELECT statements over the data tables can be run") from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
@@ -0,0 +1,128 @@
+"""Schema description for the LLM prompts, read from the live database.
+
+The tables and columns are introspected from sqlite_master and PRAGMA
+table_info the first time a prompt is built, and again only after PRAGMA
+schema_version changes. Each table becomes one compact line, e.g.
+
+    Customer (customer_id INTEGER, name TEXT, email TEXT)
+
+When the schema has more than SCHEMA_PROMPT_MAX_TABLES tables, only the ones
+whose names or columns share words with the question are described, plus the
+tables they join to (declared foreign keys, or a column named like another
+table's primary key), so large schemas don't inflate every prompt.
+"""
+import os
+import re
+import threading
+
+from connection_pool import get_pool
+from result_cache import APP_TABLES
+
+SCHEMA_PROMPT_MAX_TABLES = int(os.getenv("SCHEMA_PROMPT_MAX_TABLES", "8"))
+
+# Identifiers the model must quote when used as names
+RESERVED_WORDS = {"ORDER", "GROUP", "SELECT", "TABLE", "INDEX", "WHERE", "FROM", "JOIN", "KEY", "LIMIT",
+                  "VALUES", "CHECK", "DEFAULT", "TRANSACTION", "USER", "CASE", "END", "TO", "AS", "BY"}
+
+_lock = threading.Lock()
+_catalog = None
+_schema_version = None
+
+class Table:
+    def __init__(self, name, columns, primary_key, references):
+        self.name = name
+        # [(name, declared type)]
+        self.columns = columns
+        self.primary_key = primary_key
+        # Names of tables this one has declared foreign keys to
+        self.references = references
+        self.words = _words(name) | {word for column, _ in columns for word in _words(column)}
+
+    @property
+    def quoted_name(self):
+        if self.name.upper() in RESERVED_WORDS or not re.fullmatch(r"[A-Za-z_]\w*", self.name):
+            return '"' + self.name.replace('"', '""') + '"'
+        return self.name
+
+    def describe(self):
+        columns = ", ".join(f"{name} {col_type or 'ANY'}" for name, col_type in self.columns)
+        return f"{self.quoted_name} ({columns})"
+
+def _words(text):
+    """Lower-cased words of a name or question, with snake_case split and plural s dropped"""
+    words = set()
+    for word in re.findall(r"[a-z0-9]+", re.sub(r"([a-z])([A-Z])", r"\1 \2", text).lower()):
+        words.add(word[:-1] if len(word) > 3 and word.endswith("s") else word)
+    return words
+
+def _introspect(conn):
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+    )]
+    tables = []
+    for name in names:
+        if name in APP_TABLES:
+            continue
+        quoted = name.replace('"', '""')
+        info = conn.execute(f'PRAGMA table_info("{quoted}")').fetchall()
+        columns = [(row[1], row[2]) for row in info]
+        primary_key = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5]]
+        references = sorted({row[2] for row in conn.execute(f'PRAGMA foreign_key_list("{quoted}")')})
+        tables.append(Table(name, columns, primary_key[0] if len(primary_key) == 1 else None, references))
+    return tables
+
+def get_catalog():
+    """All data tables, re-read only when the schema has changed"""
+    global _catalog, _schema_version
+    with _lock, get_pool().connection() as conn:
+        schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        if _catalog is None or schema_version != _schema_version:
+            _catalog = _introspect(conn)
+            _schema_version = schema_version
+        return _catalog
+
+def relevant_tables(question, tables=None, max_tables=SCHEMA_PROMPT_MAX_TABLES):
+    """The tables worth describing for a question, in schema order"""
+    tables = get_catalog() if tables is None else tables
+    if len(tables) <= max_tables:
+        return tables
+    question_words = _words(question)
+    scores = {table.name: len(table.words & question_words) + 2 * len(_words(table.name) & question_words)
+              for table in tables}
+    ranked = sorted((table for table in tables if scores[table.name]), key=lambda table: -scores[table.name])
+    selected = {table.name for table in ranked[:max_tables]}
+
+    # Bring in the tables the selected ones join to, so the model can write the joins
+    by_primary_key = {table.primary_key: table.name for table in tables if table.primary_key}
+    for table in tables:
+        if table.name in selected:
+            selected.update(table.references)
+            selected.update(by_primary_key[column] for column, _ in table.columns
+                            if column in by_primary_key and column != table.primary_key)
+    if not selected:
+        return tables[:max_tables]
+    return [table for table in tables if table.name in selected]
+
+def describe_schema(tables):
+    """Schema block for the prompts, one line per table"""
+    return "\n".join(table.describe() for table in tables)
+
+def join_example(tables):
+    """A JOIN of two of the tables on a column named like one's primary key, or None if none join"""
+    by_primary_key = {table.primary_key: table for table in tables if table.primary_key}
+    for table in tables:
+        for column, _ in table.columns:
+            target = by_primary_key.get(column)
+            if target is None or target is table:
+                continue
+            alias, target_alias = table.name[0].upper(), target.name[0].upper()
+            if alias == target_alias:
+                target_alias += "2"
+            return (f"{table.quoted_name} AS {alias} JOIN {target.quoted_name} AS {target_alias} "
+                    f"ON {alias}.{column} = {target_alias}.{column}")
+    return None
+
+def describe_columns(tables):
+    """Per-table column list for the SQL prompt's syntax notes"""
+    return "\n".join(f"   - {table.quoted_name}: {', '.join(name for name, _ in table.columns)}"
+                     for table in tables)
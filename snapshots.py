@@ -0,0 +1,41 @@
+"""Compressed result snapshots for QueryHistory.
+
+The result of each /query is stored with its history entry so that replaying
+it from the history panel is a lookup instead of an LLM round trip and a
+query. Snapshots are JSON compressed with zstd when the zstandard package is
+installed, zlib otherwise; the codec is recorded in a short prefix so either
+can be read back. Snapshots larger than HISTORY_SNAPSHOT_MAX_BYTES after
+compression are not stored.
+"""
+import json
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+HISTORY_SNAPSHOTS_ENABLED = os.getenv("HISTORY_SNAPSHOTS_ENABLED", "1") == "1"
+HISTORY_SNAPSHOT_MAX_BYTES = int(os.getenv("HISTORY_SNAPSHOT_MAX_BYTES", str(1024 * 1024)))
+
+def encode_snapshot(result, max_bytes=HISTORY_SNAPSHOT_MAX_BYTES):
+    """Compressed snapshot of a result payload, or None if it is over max_bytes"""
+    raw = json.dumps(result, separators=(",", ":")).encode()
+    if zstandard is not None:
+        blob = b"zstd:" + zstandard.ZstdCompressor(level=3).compress(raw)
+    else:
+        blob = b"zlib:" + zlib.compress(raw, 6)
+    return blob if len(blob) <= max_bytes else None
+
+def decode_snapshot(blob):
+    """Result payload from a stored snapshot"""
+    if isinstance(blob, str):
+        # Entries saved before snapshots were compressed hold plain JSON
+        return json.loads(blob)
+    codec, payload = blob[:5], blob[5:]
+    if codec == b"zstd:":
+        if zstandard is None:
+            raise RuntimeError("Snapshot is zstd-compressed; install zstandard to read it")
+        return json.loads(zstandard.ZstdDecompressor().decompress(payload))
+    return json.loads(zlib.decompress(payload))
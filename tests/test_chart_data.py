@@ -0,0 +1,38 @@
+import sqlite3
+
+import pytest
+
+import chart_data
+import connection_pool
+
+@pytest.fixture
+def sales_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "genai.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Sales (category TEXT, amount INTEGER)")
+    conn.executemany("INSERT INTO Sales VALUES (?, ?)",
+                     [("Other", 100), ("a", 50), ("b", 40), ("c", 30), ("d", 20), (None, 10)])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(connection_pool, "DB_PATH", path)
+    yield path
+    for pool in connection_pool._pools.values():
+        pool.close_all()
+    connection_pool._pools.clear()
+
+def test_folded_row_does_not_merge_with_a_category_named_other(sales_db):
+    result = chart_data.reduce_for_chart("SELECT category, amount FROM Sales", "bar", "category", "amount", limit=3)
+    assert result["rows"] == [
+        {"category": "Other", "amount": 100},
+        {"category": "a", "amount": 50},
+        {"category": "Other (2)", "amount": 100},
+    ]
+    assert result["source_rows"] == 6
+
+def test_null_category_is_kept_apart_from_the_folded_row(sales_db):
+    result = chart_data.reduce_for_chart("SELECT category, amount FROM Sales", "pie", "category", "amount", limit=6)
+    assert [row["category"] for row in result["rows"]] == ["Other", "a", "b", "c", "d", None]
+
+def test_other_label():
+    assert chart_data.other_label({"a", "b"}) == "Other"
+    assert chart_data.other_label({"Other", "Other (2)"}) == "Other (3)"
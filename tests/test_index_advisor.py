@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+import connection_pool
+import index_advisor
+
+@pytest.fixture
+def shared_db(tmp_path, monkeypatch):
+    """Data and app tables in one file, the default configuration"""
+    path = str(tmp_path / "genai.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Product (product_id INTEGER PRIMARY KEY, category TEXT)")
+    conn.executemany("INSERT INTO Product (category) VALUES (?)", [(f"c{i % 10}",) for i in range(100)])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(connection_pool, "DB_PATH", path)
+    monkeypatch.setattr(connection_pool, "APP_DB_PATH", path)
+    # Fail fast rather than after the default 5s if anything waits on a lock
+    monkeypatch.setattr(connection_pool, "PRAGMAS", [(name, "100" if name == "busy_timeout" else value)
+                                                     for name, value in connection_pool.PRAGMAS])
+    monkeypatch.setattr(index_advisor, "INDEX_ADVISOR_AUTO_CREATE", True)
+    monkeypatch.setattr(index_advisor, "INDEX_ADVISOR_THRESHOLD", 2)
+    index_advisor.setup_index_advisor()
+    yield path
+    for pool in connection_pool._pools.values():
+        pool.close_all()
+    connection_pool._pools.clear()
+
+def test_auto_create_with_shared_database(shared_db):
+    sql = "SELECT * FROM Product WHERE category = 'c1'"
+    assert index_advisor.record(sql) == [("Product", "category")]
+    assert index_advisor.record(sql) == [("Product", "category")]
+
+    conn = sqlite3.connect(shared_db)
+    indexes = [row[1] for row in conn.execute('PRAGMA index_list("Product")')]
+    scans = conn.execute("SELECT scan_count FROM IndexAdvisorStats").fetchone()[0]
+    conn.close()
+    assert "idx_auto_Product_category" in indexes
+    assert scans == 2
+
+def test_index_failure_keeps_counts(shared_db, monkeypatch):
+    monkeypatch.setattr(index_advisor, "_index_statement", lambda table, column: "CREATE INDEX broken")
+    sql = "SELECT * FROM Product WHERE category = 'c1'"
+    for _ in range(3):
+        assert index_advisor.record(sql) == [("Product", "category")]
+
+    conn = sqlite3.connect(shared_db)
+    scans = conn.execute("SELECT scan_count FROM IndexAdvisorStats").fetchone()[0]
+    conn.close()
+    assert scans == 3
@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+from result_format import arrow_metadata, shape_result, to_arrow_ipc
+
+def first_page():
+    result = shape_result(["id", "name"], [(1, "a"), (2, "b")], "columnar")
+    result.update(offset=0, has_more=True, next_page_token="abc")
+    return result
+
+def test_arrow_metadata_keeps_paging_fields():
+    metadata = arrow_metadata(first_page(), sql="SELECT 1", cached=False)
+    assert metadata == {"sql": "SELECT 1", "cached": False, "offset": 0, "has_more": True,
+                        "next_page_token": "abc"}
+
+def test_arrow_metadata_of_truncated_result():
+    result = shape_result(["id"], [(1,)], "columnar")
+    result["truncated"] = True
+    assert arrow_metadata(result, sql="SELECT 1") == {"sql": "SELECT 1", "truncated": True}
+
+def test_arrow_stream_carries_paging_fields():
+    pa = pytest.importorskip("pyarrow")
+    result = first_page()
+    body = to_arrow_ipc(result, arrow_metadata(result, sql="SELECT 1", cached=False))
+    metadata = pa.ipc.open_stream(body).schema.metadata
+    assert metadata[b"sql"] == b"SELECT 1"
+    assert json.loads(metadata[b"has_more"]) is True
+    assert metadata[b"next_page_token"] == b"abc"
+    assert json.loads(metadata[b"cached"]) is False
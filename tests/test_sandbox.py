@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+import connection_pool
+import sandbox
+
+@pytest.fixture
+def data_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "genai.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Customer (customer_id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("CREATE TABLE QueryHistory (id INTEGER PRIMARY KEY, user_query TEXT)")
+    conn.execute("INSERT INTO Customer (name) VALUES ('John Doe')")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(connection_pool, "DB_PATH", path)
+    monkeypatch.setattr(sandbox, "SQL_SANDBOX_ENABLED", True)
+    yield path
+    for pool in connection_pool._pools.values():
+        pool.close_all()
+    connection_pool._pools.clear()
+
+def run(sql):
+    with sandbox.connection() as conn:
+        return conn.execute(sql).fetchall()
+
+def test_select_runs(data_db):
+    assert run("SELECT name FROM Customer") == [("John Doe",)]
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM Customer",
+    "SELECT * FROM QueryHistory",
+    "PRAGMA table_info(Customer)",
+    "SELECT load_extension('x')",
+])
+def test_denied_statements_are_mapped(data_db, sql):
+    with pytest.raises(sandbox.QueryNotAllowed, match="Only read-only SELECT statements"):
+        run(sql)
+
+def test_other_errors_pass_through(data_db):
+    with pytest.raises(sqlite3.OperationalError, match="no such table"):
+        run("SELECT * FROM Nope")
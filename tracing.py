@@ -0,0 +1,194 @@
+"""Lightweight per-request tracing and Prometheus metrics.
+
+A Trace collects span durations, LLM token counts and the result row count of
+one /query request. The active trace lives in a ContextVar, so it follows the
+request into asyncio.to_thread / run_in_threadpool workers without being passed
+around. Every span and counter also feeds process-wide aggregates that
+GET /metrics renders in the Prometheus text format. Recording a span costs two
+perf_counter calls and a short locked update.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current = ContextVar("trace", default=None)
+_lock = threading.Lock()
+# stage -> [bucket counts..., +Inf count, sum]
+_durations = {}
+_tokens = {"prompt": 0, "completion": 0}
+_requests = {}
+_rows = 0
+# llm_mode -> [requests, prompt tokens, completion tokens], for questions answered by the LLM
+_modes = {}
+
+class Trace:
+    """Measurements of a single request"""
+
+    def __init__(self):
+        self.spans = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.rows = None
+        # How the question was translated; None when it came from the translation cache
+        self.llm_mode = None
+
+    def to_dict(self):
+        return {
+            "spans_ms": {name: round(seconds * 1000, 3) for name, seconds in self.spans.items()},
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "rows": self.rows,
+            "llm_mode": self.llm_mode,
+        }
+
+def start_trace():
+    """Begin a trace for the current request and return it"""
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+def _observe(stage, seconds):
+    with _lock:
+        histogram = _durations.get(stage)
+        if histogram is None:
+            histogram = _durations[stage] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(BUCKETS)] += 1
+        histogram[-1] += seconds
+
+@contextmanager
+def span(stage):
+    """Time a block as one stage of the current request"""
+    if not TRACING_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _observe(stage, seconds)
+        trace = _current.get()
+        if trace is not None:
+            trace.spans[stage] = trace.spans.get(stage, 0.0) + seconds
+
+def record_tokens(response):
+    """Add the token usage reported in an OpenAI response"""
+    usage = getattr(response, "usage", None)
+    if not TRACING_ENABLED or usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    with _lock:
+        _tokens["prompt"] += prompt
+        _tokens["completion"] += completion
+    trace = _current.get()
+    if trace is not None:
+        trace.prompt_tokens += prompt
+        trace.completion_tokens += completion
+
+def finish_trace(trace, result):
+    """Record the outcome of a traced request"""
+    global _rows
+    if not TRACING_ENABLED:
+        return
+    status = "error" if "error" in result else "ok"
+    if status == "ok":
+        trace.rows = len(result["rows"]) if "rows" in result else len(result["data"][0]) if result["data"] else 0
+    with _lock:
+        _requests[status] = _requests.get(status, 0) + 1
+        _rows += trace.rows or 0
+        if trace.llm_mode is not None:
+            counts = _modes.setdefault(trace.llm_mode, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += trace.prompt_tokens
+            counts[2] += trace.completion_tokens
+
+def token_totals():
+    """Tokens reported by the LLM since startup"""
+    with _lock:
+        return dict(_tokens)
+
+def mode_totals():
+    """Requests and tokens per llm_mode since startup"""
+    with _lock:
+        return {mode: {"requests": counts[0], "prompt": counts[1], "completion": counts[2]}
+                for mode, counts in _modes.items()}
+
+def token_savings(modes):
+    """Share of tokens per question that single mode saves over two_call, or None without both.
+
+    Questions that fell back to two calls count against single mode, since they paid for both prompts.
+    """
+    def per_request(*names):
+        requests = sum(modes[name]["requests"] for name in names if name in modes)
+        tokens = sum(modes[name]["prompt"] + modes[name]["completion"] for name in names if name in modes)
+        return tokens / requests if requests else None
+
+    two_call, single = per_request("two_call"), per_request("single", "single_fallback")
+    if not two_call or single is None:
+        return None
+    return 1 - single / two_call
+
+def render_metrics():
+    """All aggregates in the Prometheus text exposition format"""
+    with _lock:
+        durations = {stage: list(histogram) for stage, histogram in _durations.items()}
+        tokens, requests, rows = dict(_tokens), dict(_requests), _rows
+    modes = mode_totals()
+    lines = [
+        "# HELP genai_stage_duration_seconds Time spent in each stage of a query",
+        "# TYPE genai_stage_duration_seconds histogram",
+    ]
+    for stage, histogram in sorted(durations.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram):
+            cumulative += count
+            lines.append(f'genai_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        cumulative += histogram[len(BUCKETS)]
+        lines.append(f'genai_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+        lines.append(f'genai_stage_duration_seconds_sum{{stage="{stage}"}} {histogram[-1]}')
+        lines.append(f'genai_stage_duration_seconds_count{{stage="{stage}"}} {cumulative}')
+    lines += [
+        "# HELP genai_llm_tokens_total Tokens reported by the LLM",
+        "# TYPE genai_llm_tokens_total counter",
+    ]
+    lines += [f'genai_llm_tokens_total{{type="{kind}"}} {count}' for kind, count in tokens.items()]
+    lines += [
+        "# HELP genai_queries_total Queries answered, by outcome",
+        "# TYPE genai_queries_total counter",
+    ]
+    lines += [f'genai_queries_total{{status="{status}"}} {count}' for status, count in sorted(requests.items())]
+    lines += [
+        "# HELP genai_result_rows_total Rows returned by queries",
+        "# TYPE genai_result_rows_total counter",
+        f"genai_result_rows_total {rows}",
+        "# HELP genai_llm_mode_requests_total Questions translated by the LLM, by llm_mode",
+        "# TYPE genai_llm_mode_requests_total counter",
+    ]
+    lines += [f'genai_llm_mode_requests_total{{mode="{mode}"}} {counts["requests"]}' for mode, counts in sorted(modes.items())]
+    lines += [
+        "# HELP genai_llm_mode_tokens_total Tokens reported by the LLM, by llm_mode",
+        "# TYPE genai_llm_mode_tokens_total counter",
+    ]
+    for mode, counts in sorted(modes.items()):
+        lines += [f'genai_llm_mode_tokens_total{{mode="{mode}",type="{kind}"}} {counts[kind]}' for kind in ("prompt", "completion")]
+    savings = token_savings(modes)
+    if savings is not None:
+        lines += [
+            "# HELP genai_llm_single_mode_token_savings_ratio Share of tokens per question single mode saves over two_call",
+            "# TYPE genai_llm_single_mode_token_savings_ratio gauge",
+            f"genai_llm_single_mode_token_savings_ratio {savings:.4f}",
+        ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,239 @@
+"""Cache of NL→SQL translations keyed on the normalized question text.
+
+Questions are normalized (case, whitespace, plain punctuation) and their
+literals (quoted strings and numbers) are replaced by placeholders, so "top 3
+customers" and "Top 5 customers?" share one entry. Comparison operators and
+other symbols that change the meaning (< > = ! % -) are kept, so "total > 250"
+and "total < 250" don't. When every literal occurs exactly once
+in the generated SQL (and at most once in the understanding), and never as a
+GROUP BY/ORDER BY ordinal or a function argument, the entry is stored as a
+template and the new literals are filled back in on a hit; otherwise the
+literals stay part of the key. Callers discard() an entry whose SQL fails.
+
+Entries live in an in-memory LRU backed by the TranslationCache table and are
+dropped after TRANSLATION_CACHE_TTL seconds or when the database schema changes.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from connection_pool import get_pool, get_app_pool
+
+TRANSLATION_CACHE_ENABLED = os.getenv("TRANSLATION_CACHE_ENABLED", "1") == "1"
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", "86400"))
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "1024"))
+
+# Single-quoted strings (not apostrophes inside words) and standalone numbers
+LITERAL_PATTERN = re.compile(r"(?<!\w)'([^']+)'(?!\w)|(?<![\w.])(\d+(?:\.\d+)?)(?![\w.])")
+PLACEHOLDER_PATTERN = re.compile(r"\{\{(\d+)\}\}")
+# Symbols that carry meaning in a question, as separate tokens so spacing around them doesn't matter;
+# a lone "!" is punctuation
+OPERATOR_PATTERN = re.compile(r"[<>!]=|<>|[<>=%-]")
+PUNCTUATION_PATTERN = re.compile(r"!(?!=)|[^\w\s#<>=!%-]")
+ORDINAL_CLAUSE_PATTERN = re.compile(r"\b(?:GROUP|ORDER)\s+BY\b", re.IGNORECASE)
+CLAUSE_END_PATTERN = re.compile(
+    r"\b(?:SELECT|FROM|WHERE|HAVING|LIMIT|OFFSET|UNION|EXCEPT|INTERSECT|WINDOW)\b|[();]", re.IGNORECASE)
+# Words that can precede a parenthesis without making it a function call
+SQL_KEYWORDS = {"IN", "VALUES", "AND", "OR", "NOT", "ON", "WHERE", "WHEN", "THEN", "ELSE", "AS", "SELECT",
+                "FROM", "JOIN", "HAVING", "EXISTS", "BETWEEN", "IS", "LIKE", "CASE", "USING", "BY", "WITH"}
+
+_lock = threading.Lock()
+_memory = OrderedDict()
+_stats = {"hits": 0, "memory_hits": 0, "persistent_hits": 0, "misses": 0,
+          "expired": 0, "invalidated": 0, "stores": 0, "discarded": 0}
+
+def normalize_question(user_query):
+    """Return (template_text, literals) for a natural language question"""
+    literals = []
+
+    def replace(match):
+        literals.append(match.group(1) if match.group(1) is not None else match.group(2))
+        return " # "
+
+    text = LITERAL_PATTERN.sub(replace, user_query)
+    text = PUNCTUATION_PATTERN.sub(" ", text.lower())
+    text = OPERATOR_PATTERN.sub(lambda match: f" {match.group(0)} ", text)
+    return " ".join(text.split()), literals
+
+def _exact_key(template_text, literals):
+    """Key used when the translation can't be templated on its literals"""
+    for literal in literals:
+        template_text = template_text.replace("#", repr(literal), 1)
+    return "=" + template_text
+
+def _literal_regex(literals):
+    alternatives = []
+    for i, literal in enumerate(literals):
+        if re.fullmatch(r"\d+(?:\.\d+)?", literal):
+            alternatives.append(rf"(?P<l{i}>(?<![\w.]){re.escape(literal)}(?![\w.]))")
+        else:
+            alternatives.append(rf"(?P<l{i}>{re.escape(literal)})")
+    return re.compile("|".join(alternatives))
+
+def _is_structural(sql, start):
+    """Whether a literal at start is a GROUP BY/ORDER BY ordinal or a function argument, i.e. part of
+    the query's shape that the same number in the question doesn't control"""
+    depth = 0
+    for i in range(start - 1, -1, -1):
+        if sql[i] == ")":
+            depth += 1
+        elif sql[i] == "(":
+            if depth == 0:
+                name = re.search(r"(\w+)\s*$", sql[:i])
+                if name and name.group(1).upper() not in SQL_KEYWORDS:
+                    return True
+                break
+            depth -= 1
+    clause = None
+    for clause in ORDINAL_CLAUSE_PATTERN.finditer(sql, 0, start):
+        pass
+    return clause is not None and not CLAUSE_END_PATTERN.search(sql, clause.end(), start)
+
+def _templatize(text, literals, is_sql=False):
+    """Replace each literal in text with {{i}}; returns (template, occurrences) where occurrences[i]
+    is how often literal i was found, or None if it appeared in a structural position of the SQL"""
+    occurrences = {}
+
+    def replace(match):
+        index = int(match.lastgroup[1:])
+        if occurrences.get(index, 0) is not None:
+            if is_sql and _is_structural(text, match.start()):
+                occurrences[index] = None
+            else:
+                occurrences[index] = occurrences.get(index, 0) + 1
+        return "{{%d}}" % index
+
+    return _literal_regex(literals).sub(replace, text), occurrences
+
+def _fill(template, literals):
+    return PLACEHOLDER_PATTERN.sub(lambda m: literals[int(m.group(1))], template)
+
+def _schema_version():
+    # Translations are only valid for the data tables they were generated against
+    with get_pool().connection() as conn:
+        return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+def setup_translation_cache():
+    with get_app_pool().connection() as conn:
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS TranslationCache (
+            cache_key TEXT PRIMARY KEY,
+            sql_template TEXT,
+            understanding_template TEXT,
+            schema_version INTEGER,
+            created_at REAL
+        )
+        """)
+        conn.commit()
+
+def _load(conn, cache_key):
+    """Memory first, then the persistent table; returns the entry tuple or None"""
+    entry = _memory.get(cache_key)
+    if entry is not None:
+        _memory.move_to_end(cache_key)
+        return entry, "memory"
+    row = conn.execute("""
+    SELECT sql_template, understanding_template, schema_version, created_at
+    FROM TranslationCache WHERE cache_key = ?
+    """, (cache_key,)).fetchone()
+    if row is None:
+        return None, None
+    _remember(cache_key, row)
+    return row, "persistent"
+
+def _remember(cache_key, entry):
+    _memory[cache_key] = entry
+    _memory.move_to_end(cache_key)
+    while len(_memory) > TRANSLATION_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+def _evict(conn, cache_key):
+    _memory.pop(cache_key, None)
+    conn.execute("DELETE FROM TranslationCache WHERE cache_key = ?", (cache_key,))
+    conn.commit()
+
+def discard(cache_key):
+    """Drop an entry, e.g. because the SQL it produced failed to execute"""
+    with _lock, get_app_pool().connection() as conn:
+        _evict(conn, cache_key)
+        _stats["discarded"] += 1
+
+def lookup(user_query):
+    """Return a cached {"understanding", "sql", "cache_key"} for the question, or None"""
+    if not TRANSLATION_CACHE_ENABLED:
+        return None
+    template_text, literals = normalize_question(user_query)
+    schema_version = _schema_version()
+    with _lock, get_app_pool().connection() as conn:
+        cache_keys = ["~" + template_text]
+        if literals:
+            cache_keys.append(_exact_key(template_text, literals))
+        for cache_key in cache_keys:
+            entry, source = _load(conn, cache_key)
+            if entry is None:
+                continue
+            sql_template, understanding_template, entry_schema_version, created_at = entry
+            if time.time() - created_at > TRANSLATION_CACHE_TTL:
+                _stats["expired"] += 1
+                _evict(conn, cache_key)
+                continue
+            if entry_schema_version != schema_version:
+                _stats["invalidated"] += 1
+                _evict(conn, cache_key)
+                continue
+            _stats["hits"] += 1
+            _stats[f"{source}_hits"] += 1
+            return {
+                "understanding": _fill(understanding_template, literals),
+                "sql": _fill(sql_template, literals),
+                "cache_key": cache_key
+            }
+        _stats["misses"] += 1
+        return None
+
+def store(user_query, sql, understanding):
+    """Cache a translation that executed successfully"""
+    if not TRANSLATION_CACHE_ENABLED:
+        return
+    template_text, literals = normalize_question(user_query)
+    cache_key = None
+    if literals and len(set(literals)) == len(literals):
+        sql_template, in_sql = _templatize(sql, literals, is_sql=True)
+        understanding_template, in_understanding = _templatize(understanding, literals)
+        # A literal repeated elsewhere in the SQL (LIMIT 1 next to COUNT(1) > 1, say) can't be told
+        # apart from the one the question controls, so those translations aren't templated
+        if (all(in_sql.get(i) == 1 for i in range(len(literals)))
+                and all(in_understanding.get(i, 0) in (0, 1) for i in range(len(literals)))):
+            cache_key = "~" + template_text
+    elif not literals:
+        sql_template, understanding_template = sql, understanding
+        cache_key = "~" + template_text
+    if cache_key is None:
+        # Some literal can't be mapped to one place in the SQL, so only reuse for the exact question
+        sql_template, understanding_template = sql, understanding
+        cache_key = _exact_key(template_text, literals)
+
+    entry = (sql_template, understanding_template, _schema_version(), time.time())
+    with _lock, get_app_pool().connection() as conn:
+        conn.execute("""
+        INSERT OR REPLACE INTO TranslationCache
+            (cache_key, sql_template, understanding_template, schema_version, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        """, (cache_key,) + entry)
+        conn.commit()
+        _remember(cache_key, entry)
+        _stats["stores"] += 1
+
+def get_stats():
+    """Hit/miss counters; every hit is a pair of LLM calls that wasn't paid for"""
+    with _lock, get_app_pool().connection() as conn:
+        stats = dict(_stats)
+        stats["memory_entries"] = len(_memory)
+        stats["persistent_entries"] = conn.execute(
+            "SELECT COUNT(*) FROM TranslationCache").fetchone()[0]
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["llm_calls_saved"] = stats["hits"] * 2
+    return stats